@@ -2,11 +2,15 @@ from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.cli import CLI
 from mininet.log import setLogLevel
-from mininet.node import OVSBridge
+from mininet.node import OVSBridge, OVSSwitch, RemoteController
+import sys
 
 class FatTree(Topo):
-    def build(self):
+    def build(self, remote=False):
         switchOpts = {'cls': OVSBridge,'stp': 1}
+        # with a remote controller (ecmp_forward.py in Lab3) the switches run OpenFlow 1.3 without stp
+        if remote:
+            switchOpts = {'cls': OVSSwitch, 'protocols': 'OpenFlow13'}
         "Create custom topo."
         # Add hosts and switches
         # Add hosts in pod1
@@ -30,28 +34,29 @@ class FatTree(Topo):
         Host43 = self.addHost('h43')
         Host44 = self.addHost('h44')
         # Add Access Layer Switchs
-        AcsSwitch12 = self.addSwitch('AcS12', **switchOpts)
-        AcsSwitch21 = self.addSwitch('AcS21', **switchOpts)
-        AcsSwitch22 = self.addSwitch('AcS22', **switchOpts)
-        AcsSwitch31 = self.addSwitch('AcS31', **switchOpts)
-        AcsSwitch11 = self.addSwitch('AcS11', **switchOpts)
-        AcsSwitch32 = self.addSwitch('AcS32', **switchOpts)
-        AcsSwitch41 = self.addSwitch('AcS41', **switchOpts)
-        AcsSwitch42 = self.addSwitch('AcS42', **switchOpts)
+        # the names share digits across layers, so every switch gets its own dpid: layer, then number
+        AcsSwitch12 = self.addSwitch('AcS12', dpid='%016x' % 0x3012, **switchOpts)
+        AcsSwitch21 = self.addSwitch('AcS21', dpid='%016x' % 0x3021, **switchOpts)
+        AcsSwitch22 = self.addSwitch('AcS22', dpid='%016x' % 0x3022, **switchOpts)
+        AcsSwitch31 = self.addSwitch('AcS31', dpid='%016x' % 0x3031, **switchOpts)
+        AcsSwitch11 = self.addSwitch('AcS11', dpid='%016x' % 0x3011, **switchOpts)
+        AcsSwitch32 = self.addSwitch('AcS32', dpid='%016x' % 0x3032, **switchOpts)
+        AcsSwitch41 = self.addSwitch('AcS41', dpid='%016x' % 0x3041, **switchOpts)
+        AcsSwitch42 = self.addSwitch('AcS42', dpid='%016x' % 0x3042, **switchOpts)
         # Add Distribution Layer Switchs
-        DstSwitch11 = self.addSwitch('DstS11', **switchOpts)
-        DstSwitch12 = self.addSwitch('DstS12', **switchOpts)
-        DstSwitch21 = self.addSwitch('DstS21', **switchOpts)
-        DstSwitch22 = self.addSwitch('DstS22', **switchOpts)
-        DstSwitch31 = self.addSwitch('DstS31', **switchOpts)
-        DstSwitch32 = self.addSwitch('DstS32', **switchOpts)
-        DstSwitch41 = self.addSwitch('DstS41', **switchOpts)
-        DstSwitch42 = self.addSwitch('DstS42', **switchOpts)
+        DstSwitch11 = self.addSwitch('DstS11', dpid='%016x' % 0x2011, **switchOpts)
+        DstSwitch12 = self.addSwitch('DstS12', dpid='%016x' % 0x2012, **switchOpts)
+        DstSwitch21 = self.addSwitch('DstS21', dpid='%016x' % 0x2021, **switchOpts)
+        DstSwitch22 = self.addSwitch('DstS22', dpid='%016x' % 0x2022, **switchOpts)
+        DstSwitch31 = self.addSwitch('DstS31', dpid='%016x' % 0x2031, **switchOpts)
+        DstSwitch32 = self.addSwitch('DstS32', dpid='%016x' % 0x2032, **switchOpts)
+        DstSwitch41 = self.addSwitch('DstS41', dpid='%016x' % 0x2041, **switchOpts)
+        DstSwitch42 = self.addSwitch('DstS42', dpid='%016x' % 0x2042, **switchOpts)
         # Add Core Layer Switchs
-        CoreSwitch1 = self.addSwitch('CoreS1', **switchOpts)
-        CoreSwitch2 = self.addSwitch('CoreS2', **switchOpts)
-        CoreSwitch3 = self.addSwitch('CoreS3', **switchOpts)
-        CoreSwitch4 = self.addSwitch('CoreS4', **switchOpts)
+        CoreSwitch1 = self.addSwitch('CoreS1', dpid='%016x' % 0x1001, **switchOpts)
+        CoreSwitch2 = self.addSwitch('CoreS2', dpid='%016x' % 0x1002, **switchOpts)
+        CoreSwitch3 = self.addSwitch('CoreS3', dpid='%016x' % 0x1003, **switchOpts)
+        CoreSwitch4 = self.addSwitch('CoreS4', dpid='%016x' % 0x1004, **switchOpts)
         # Add links
         # Add links between Core Layer and Distribution Layer
         self.addLink(CoreSwitch1, DstSwitch11)
@@ -106,9 +111,12 @@ class FatTree(Topo):
         self.addLink(AcsSwitch42, Host44)
 
 
-def run():
-    topo = FatTree()
-    net = Mininet(topo)
+def run(remote=False):
+    topo = FatTree(remote=remote)
+    if remote:
+        net = Mininet(topo, controller=RemoteController)
+    else:
+        net = Mininet(topo)
     net.start()
     net.waitConnected()
     CLI(net)
@@ -117,4 +125,5 @@ def run():
 
 if __name__ == '__main__':
     setLogLevel('info')
-    run()
+    # python "Fat tree.py" remote: let a ryu controller route instead of stp
+    run(remote='remote' in sys.argv[1:])
@@ -0,0 +1,53 @@
+import time
+
+BARRIER_TIMEOUT = 5  # seconds before a batch whose switches did not all answer is dropped
+
+
+class BarrierBatch(object):
+    def __init__(self, callback, args, now):
+        self.callback = callback
+        self.args = args
+        self.started = now
+        self.waiting = set()  # (dpid, xid) of the barrier requests not answered yet
+
+
+class BarrierTracker(object):
+    # runs a callback once every switch of a batch has answered a barrier request,
+    # that is once each of them has applied every message sent to it before;
+    # replies are matched on xid so nothing blocks while waiting
+    def __init__(self, timeout=BARRIER_TIMEOUT):
+        self.timeout = timeout
+        self.pending = {}  # (dpid, xid): BarrierBatch
+        self.batches = 0
+        self.timeouts = 0
+
+    def wait(self, datapaths, callback, *args):
+        self.batches += 1
+        batch = BarrierBatch(callback, args, time.monotonic())
+        for datapath in datapaths:
+            req = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+            datapath.set_xid(req)
+            key = (datapath.id, req.xid)
+            batch.waiting.add(key)
+            self.pending[key] = batch
+            datapath.send_msg(req)
+        if not batch.waiting:
+            callback(*args)
+
+    def reply(self, msg):
+        key = (msg.datapath.id, msg.xid)
+        batch = self.pending.pop(key, None)
+        if batch is None:
+            return
+        batch.waiting.discard(key)
+        if not batch.waiting:
+            batch.callback(*batch.args)
+
+    # forget the batches a switch never answered, their callbacks do not run
+    def expire(self, now):
+        for key, batch in list(self.pending.items()):
+            if now - batch.started > self.timeout:
+                del self.pending[key]
+                if batch.waiting:
+                    batch.waiting.clear()
+                    self.timeouts += 1
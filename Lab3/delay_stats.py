@@ -0,0 +1,100 @@
+import numpy as np
+
+DELAY_WINDOW = 32   # samples kept per link or datapath
+EWMA_ALPHA = 0.3    # weight of the newest sample in the ewma
+STATS = ('last', 'ewma', 'min', 'p50', 'p99')
+
+
+class DelaySeries(object):
+    # a fixed-size ring buffer of delay samples per key (link or dpid), all held
+    # in one (keys x window) array so a statistic over every key is one numpy call;
+    # memory only grows with the number of keys, never with the running time
+    def __init__(self, window=DELAY_WINDOW, alpha=EWMA_ALPHA, capacity=64):
+        self.window = window
+        self.alpha = alpha
+        self.rows = {}    # key: row in samples
+        self.free = []    # rows of removed keys, reused first
+        self.samples = np.full((capacity, window), np.nan)
+        self.count = np.zeros(capacity, dtype=np.int64)  # samples ever written per row
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def _row(self, key):
+        row = self.rows.get(key)
+        if row is not None:
+            return row
+        if self.free:
+            row = self.free.pop()
+        else:
+            row = len(self.rows)
+            if row == len(self.samples):
+                self.samples = np.vstack([self.samples, np.full(self.samples.shape, np.nan)])
+                self.count = np.concatenate([self.count, np.zeros_like(self.count)])
+        self.rows[key] = row
+        return row
+
+    def add(self, key, value):
+        row = self._row(key)
+        self.samples[row, self.count[row] % self.window] = value
+        self.count[row] += 1
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        self.samples[row] = np.nan
+        self.count[row] = 0
+        self.free.append(row)
+
+    def _used(self):
+        keys = list(self.rows)
+        rows = np.array([self.rows[key] for key in keys], dtype=np.int64)
+        return keys, rows
+
+    def last(self):
+        keys, rows = self._used()
+        if not keys:
+            return {}
+        values = self.samples[rows, (self.count[rows] - 1) % self.window]
+        return dict(zip(keys, values.tolist()))
+
+    def ewma(self):
+        keys, rows = self._used()
+        if not keys:
+            return {}
+        samples = self.samples[rows]
+        head = (self.count[rows] - 1) % self.window
+        # age 0 is the newest sample of each row, window - 1 the oldest
+        age = (head[:, None] - np.arange(self.window)[None, :]) % self.window
+        weights = (1 - self.alpha) ** age
+        weights[np.isnan(samples)] = 0
+        values = np.nansum(samples * weights, axis=1) / weights.sum(axis=1)
+        return dict(zip(keys, values.tolist()))
+
+    def min(self):
+        keys, rows = self._used()
+        if not keys:
+            return {}
+        return dict(zip(keys, np.nanmin(self.samples[rows], axis=1).tolist()))
+
+    def percentile(self, q):
+        keys, rows = self._used()
+        if not keys:
+            return {}
+        return dict(zip(keys, np.nanpercentile(self.samples[rows], q, axis=1).tolist()))
+
+    # key: value of one of STATS for every key with samples
+    def stat(self, name):
+        if name == 'last':
+            return self.last()
+        if name == 'ewma':
+            return self.ewma()
+        if name == 'min':
+            return self.min()
+        if name.startswith('p'):
+            return self.percentile(float(name[1:]))
+        raise ValueError('unknown delay statistic %s' % name)
@@ -0,0 +1,23 @@
+# ryu-manager dest_forward.py --observe-links
+# with: sudo python topo_1970.py
+from ryu.ofproto import ofproto_v1_3
+from ecmp_forward import EcmpForward
+from dest_rules import dest_tree
+
+
+class DestForward(EcmpForward):
+    # destination based forwarding with a single next hop: every switch gets
+    # one ipv4_dst rule per known host ip, pointing along a shortest path tree
+    # towards the host by self.weight, so a table holds O(hosts) rules whatever
+    # the traffic and one rule serves every source; the rules are kept by
+    # EcmpForward, which sends a plain output instead of a group for one port
+    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+
+    # dst_dpid: {dpid: (out port,)} of every switch towards each switch in dst_dpids
+    def ecmp_next_hops(self, dst_dpids):
+        link_info = self.network_awareness.link_info
+        hops = {}
+        for dst_dpid in dst_dpids:
+            tree = dest_tree(self.network_awareness.topo_map, dst_dpid, self.weight)
+            hops[dst_dpid] = dict((dpid, (link_info[(dpid, next_dpid)],)) for dpid, next_dpid in tree.items())
+        return hops
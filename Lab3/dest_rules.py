@@ -0,0 +1,65 @@
+import networkx as nx
+
+from link_cost import edge_cost
+
+
+# {dpid: next dpid} of every switch that reaches dst, along a shortest path tree
+# by weight; links cost the same both ways so the tree grows out of dst
+def dest_tree(graph, dst, weight='hop'):
+    if dst not in graph:
+        return {}
+    # hop and delay are on every edge, other costs come from link_cost
+    if weight not in ('hop', 'delay'):
+        weight = lambda u, v, data, name=weight: edge_cost(name, data)
+    paths = nx.single_source_dijkstra_path(graph, dst, weight=weight)
+    return dict((path[-1], path[-2]) for path in paths.values() if len(path) > 1)
+
+
+# {dpid: number of rules} from the dpid of every rule
+def occupancy(dpids):
+    tables = {}
+    for dpid in dpids:
+        tables[dpid] = tables.get(dpid, 0) + 1
+    return tables
+
+
+# rules of exact (in_port, src, dst) forwarding, two on each switch of the path of a pair
+def pair_rules(paths):
+    for path in paths:
+        for dpid in path:
+            yield dpid
+            yield dpid
+
+
+# rules of destination forwarding, one for each host on every switch that reaches it
+def dest_rules(graph, host_switches, weight='hop'):
+    trees = {}
+    for dst_dpid in host_switches:
+        if dst_dpid not in trees:
+            trees[dst_dpid] = dest_tree(graph, dst_dpid, weight)
+        yield dst_dpid
+        for dpid in trees[dst_dpid]:
+            yield dpid
+
+
+# links of the 1970 arpanet of topo_1970.py with their delay in ms
+ARPANET_1970 = [(1, 9, 10), (2, 3, 11), (2, 4, 13), (3, 4, 14), (4, 5, 15),
+                (5, 9, 29), (5, 6, 17), (6, 7, 10), (7, 8, 62), (8, 9, 17)]
+
+
+if __name__ == '__main__':
+    # python dest_rules.py: flow table size with a flow between every pair of hosts,
+    # one host on every switch
+    from graph_engine import random_topology
+
+    arpanet = nx.Graph()
+    for u, v, delay in ARPANET_1970:
+        arpanet.add_edge(u, v, hop=1, delay=delay, is_host=False)
+    for name, graph in [('arpanet 1970', arpanet), ('100 switches', random_topology(100, degree=3))]:
+        hosts = sorted(graph.nodes)
+        paths = [nx.dijkstra_path(graph, src, dst, weight='delay')
+                 for src in hosts for dst in hosts if src < dst]
+        for mode, tables in [('pair', occupancy(pair_rules(paths))),
+                             ('dest', occupancy(dest_rules(graph, hosts, 'delay')))]:
+            print('{}, {} hosts, {} rules: {} in all, {} on the fullest switch'.format(
+                name, len(hosts), mode, sum(tables.values()), max(tables.values())))
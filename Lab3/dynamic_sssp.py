@@ -0,0 +1,140 @@
+import heapq
+import time
+
+INF = float('inf')
+
+
+class DynamicSSSP(object):
+    # single source shortest path tree over topo_map that is repaired in place
+    # when the weight of one link changes (Ramalingam-Reps): only the nodes whose
+    # distance really moves are visited, not the whole graph
+    def __init__(self, graph, source, weight='delay', version=0):
+        self.graph = graph    # nx.Graph, read for the adjacency and current weights
+        self.source = source
+        self.weight = weight
+        self.version = version  # topo_version of NetworkAwareness this tree is valid for
+        self.dist = {}
+        self.parent = {}
+        self.children = {}
+        self.touched = 0      # nodes visited by the last build or repair
+        self.build()
+
+    def _w(self, u, v):
+        return self.graph[u][v].get(self.weight, 1)
+
+    def _set_parent(self, node, parent):
+        old = self.parent.get(node)
+        if old is not None:
+            self.children[old].discard(node)
+        self.parent[node] = parent
+        if parent is not None:
+            self.children.setdefault(parent, set()).add(node)
+
+    def build(self):
+        self.dist = {self.source: 0}
+        self.parent = {self.source: None}
+        self.children = {}
+        self.touched = 0
+        self._propagate([(0, self.source)])
+
+    def _propagate(self, heap, region=None):
+        # plain dijkstra from the nodes in heap, limited to region when given
+        heapq.heapify(heap)
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > self.dist.get(u, INF):
+                continue
+            self.touched += 1
+            for v in self.graph[u]:
+                if region is not None and v not in region:
+                    continue
+                nd = d + self._w(u, v)
+                if nd < self.dist.get(v, INF):
+                    self.dist[v] = nd
+                    self._set_parent(v, u)
+                    heapq.heappush(heap, (nd, v))
+
+    def update_edge(self, u, v, old_weight):
+        # the graph already holds the new weight of (u, v)
+        self.touched = 0
+        new_weight = self._w(u, v)
+        if new_weight < old_weight:
+            self._decrease(u, v, new_weight)
+        elif new_weight > old_weight:
+            # only a tree link can make distances grow
+            if self.parent.get(v) == u:
+                self._increase(v)
+            elif self.parent.get(u) == v:
+                self._increase(u)
+
+    def _decrease(self, u, v, weight):
+        heap = []
+        for a, b in [(u, v), (v, u)]:
+            nd = self.dist.get(a, INF) + weight
+            if nd < self.dist.get(b, INF):
+                self.dist[b] = nd
+                self._set_parent(b, a)
+                heap.append((nd, b))
+        self._propagate(heap)
+
+    def _increase(self, root):
+        # every node under root may now be reached better from outside the subtree
+        region = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            region.add(node)
+            stack.extend(self.children.get(node, ()))
+        heap = []
+        for node in region:
+            self.dist[node] = INF
+            best, best_parent = INF, None
+            for nbr in self.graph[node]:
+                if nbr in region:
+                    continue
+                d = self.dist.get(nbr, INF) + self._w(nbr, node)
+                if d < best:
+                    best, best_parent = d, nbr
+            self._set_parent(node, best_parent)
+            if best_parent is not None:
+                self.dist[node] = best
+                heap.append((best, node))
+        self._propagate(heap, region)
+        for node in region:
+            if self.dist[node] == INF:
+                del self.dist[node]
+
+    def path_to(self, dst):
+        if dst not in self.dist:
+            return None
+        path = [dst]
+        while path[-1] != self.source:
+            path.append(self.parent[path[-1]])
+        path.reverse()
+        return path
+
+
+if __name__ == '__main__':
+    # python dynamic_sssp.py: repair cost against a full rebuild as the graph grows
+    import random
+    from graph_engine import random_topology
+
+    random.seed(3)
+    for n in [1000, 4000, 16000]:
+        graph = random_topology(n)
+        tree = DynamicSSSP(graph, 1)
+        start = time.time()
+        tree.build()
+        build_time, build_touched = time.time() - start, tree.touched
+        edges = list(graph.edges)
+        repair_time, repair_touched = 0, 0
+        for _ in range(200):
+            u, v = random.choice(edges)
+            old = graph[u][v]['delay']
+            graph[u][v]['delay'] = max(1.0, old * random.uniform(0.5, 1.5))
+            start = time.time()
+            tree.update_edge(u, v, old)
+            repair_time += time.time() - start
+            repair_touched += tree.touched
+        print('{} switches: rebuild {:.2f} ms / {} nodes, repair {:.3f} ms / {:.1f} nodes'.format(
+            n, build_time * 1000, build_touched, repair_time * 1000 / 200, repair_touched / 200.0))
@@ -0,0 +1,54 @@
+from ryu.lib import hub
+
+from probe_stamp import now_ns, pack_stamp, unpack_stamp, SEQ_MASK
+
+ECHO_RATE = 1000   # echo requests per second, 0 sends a whole sweep at once
+ECHO_TIMEOUT = 2   # seconds before an unanswered echo request counts as lost
+
+
+class EchoProber(object):
+    # controller to switch rtt by echo request/reply, matched on xid so every
+    # switch can be probed at once instead of one by one with a sleep in between;
+    # the payload carries a binary monotonic send time, see probe_stamp
+    def __init__(self, rate=ECHO_RATE, timeout=ECHO_TIMEOUT):
+        self.rate = rate
+        self.timeout = timeout
+        self.seq = 0
+        self.pending = {}  # (dpid, xid): (seq, send time in ns)
+        self.rtt = {}      # dpid: last rtt in seconds
+        self.sent = 0
+        self.lost = 0
+
+    def sweep(self, datapaths):
+        expire = now_ns() - int(self.timeout * 1e9)
+        for key, (seq, send_time) in list(self.pending.items()):
+            if send_time < expire:
+                del self.pending[key]
+                self.lost += 1
+        for datapath in list(datapaths):
+            self.send(datapath)
+            if self.rate:
+                hub.sleep(1.0 / self.rate)
+
+    def send(self, datapath):
+        parser = datapath.ofproto_parser
+        self.seq = (self.seq + 1) & SEQ_MASK
+        send_time = now_ns()
+        echo_req = parser.OFPEchoRequest(datapath, data=pack_stamp(self.seq, send_time))
+        # take the xid now so the reply can be matched whenever it comes back
+        datapath.set_xid(echo_req)
+        self.pending[(datapath.id, echo_req.xid)] = (self.seq, send_time)
+        datapath.send_msg(echo_req)
+        self.sent += 1
+
+    # rtt in seconds of the request msg answers, None if it is unknown or too late
+    def reply(self, msg):
+        recv_time = now_ns()
+        pending = self.pending.pop((msg.datapath.id, msg.xid), None)
+        stamp = unpack_stamp(msg.data)
+        # the switch must echo back the stamp of the request it answers
+        if pending is None or stamp is None or stamp[1] != pending[0]:
+            return None
+        rtt = (recv_time - stamp[0]) / 1e9
+        self.rtt[msg.datapath.id] = rtt
+        return rtt
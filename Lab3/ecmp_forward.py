@@ -0,0 +1,126 @@
+# ryu-manager ecmp_forward.py --observe-links
+# with: sudo python "Lab1/Fat tree.py" remote
+from ryu.ofproto import ofproto_v1_3
+from ryu.lib import hub
+from ryu.lib.packet import ether_types
+from shortest_forward import ShortestForward
+from pipeline import FORWARD_TABLE
+from dest_rules import occupancy
+import networkx as nx
+
+ECMP_INTERVAL = 1  # seconds between two checks of the topology for changes
+
+
+class EcmpForward(ShortestForward):
+    # destination based equal-cost multipath: every switch gets one rule per
+    # known host ip, pointing at an OFPGT_SELECT group with a bucket for each
+    # neighbour on a shortest path to the host, so flows hash across all of
+    # them; arp is handled as in ShortestForward
+    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+
+    def __init__(self, *args, **kwargs):
+        super(EcmpForward, self).__init__(*args, **kwargs)
+        self.ecmp_version = None  # (topo_version, hosts) the rules were last derived from
+        self.ecmp_rules = {}      # (dpid, host ip): out ports of the rule installed on dpid
+        self.ecmp_thread = hub.spawn(self._ecmp_loop)
+
+    def _ecmp_loop(self):
+        while True:
+            self.refresh_ecmp()
+            hub.sleep(ECMP_INTERVAL)
+
+    def handle_ipv4(self, msg, src_ip, dst_ip, pkt_type):
+        # the rules of a host just learned may not be there yet
+        self.refresh_ecmp()
+        location = self.network_awareness.host_ip.get(dst_ip)
+        if location is not None:
+            self.send_to_host(msg, location)
+
+    # dst_dpid: {dpid: out ports} of every switch towards each switch in dst_dpids along all shortest paths by hop
+    def ecmp_next_hops(self, dst_dpids):
+        topo_map = self.network_awareness.topo_map
+        link_info = self.network_awareness.link_info
+        hops = {}
+        for dst_dpid in dst_dpids:
+            hops[dst_dpid] = {}
+            if dst_dpid not in topo_map:
+                continue
+            dist = nx.single_source_shortest_path_length(topo_map, dst_dpid)
+            for dpid, d in dist.items():
+                if dpid != dst_dpid:
+                    hops[dst_dpid][dpid] = tuple(sorted(
+                        link_info[(dpid, nbr)] for nbr in topo_map[dpid] if dist.get(nbr) == d - 1))
+        return hops
+
+    # derive the rules every switch should have and send only the ones that differ
+    def refresh_ecmp(self):
+        hosts = dict(self.network_awareness.host_ip)
+        version = (self.network_awareness.topo_version, tuple(sorted(hosts.items())))
+        if version == self.ecmp_version:
+            return
+        self.ecmp_version = version
+        hops = self.ecmp_next_hops(set(dpid for dpid, port_no in hosts.values()))
+        rules = {}
+        for ip, (dst_dpid, port_no) in hosts.items():
+            rules[(dst_dpid, ip)] = (port_no,)
+            for dpid, ports in hops[dst_dpid].items():
+                rules[(dpid, ip)] = ports
+        changed = 0
+        for (dpid, ip), ports in rules.items():
+            if self.ecmp_rules.get((dpid, ip)) != ports:
+                self.send_ecmp_flow_mod(dpid, ip, ports)
+                changed += 1
+        for (dpid, ip), ports in list(self.ecmp_rules.items()):
+            if (dpid, ip) not in rules:
+                self.send_ecmp_flow_delete(dpid, ip)
+                changed += 1
+        if changed:
+            tables = self.table_occupancy()
+            self.logger.info('destination rules: {} changed, {} on {} switches, {} at most'.format(
+                changed, sum(tables.values()), len(tables), max(tables.values()) if tables else 0))
+
+    def _select_group(self, dp, ports):
+        ofp = dp.ofproto
+        parser = dp.ofproto_parser
+        key = (ofproto_v1_3.OFPGT_SELECT, ports)
+        group_id, new = self.groups.acquire(dp.id, key)
+        if new:
+            buckets = [parser.OFPBucket(weight=1, watch_port=ofp.OFPP_ANY, watch_group=ofp.OFPG_ANY,
+                                        actions=[parser.OFPActionOutput(port)]) for port in ports]
+            self.send_group_mod(dp, ofp.OFPGC_ADD, ofp.OFPGT_SELECT, group_id, buckets)
+        return group_id
+
+    def _release_ports(self, dpid, ports):
+        if ports is None or len(ports) < 2:
+            return
+        key = (ofproto_v1_3.OFPGT_SELECT, ports)
+        group_id = self.groups.release(dpid, key)
+        dp = self.network_awareness.switch_info.get(dpid)
+        if group_id is not None and dp is not None:
+            self.send_group_mod(dp, dp.ofproto.OFPGC_DELETE, key[0], group_id, [])
+
+    def send_ecmp_flow_mod(self, dpid, ip, ports):
+        dp = self.network_awareness.switch_info.get(dpid)
+        if dp is None:
+            return
+        parser = dp.ofproto_parser
+        if len(ports) > 1:
+            actions = [parser.OFPActionGroup(self._select_group(dp, ports))]
+        else:
+            actions = [parser.OFPActionOutput(ports[0])]
+        match = parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=ip)
+        self.add_flow(dp, 1, match, actions)
+        # the old group goes only after the rule no longer points at it
+        self._release_ports(dpid, self.ecmp_rules.get((dpid, ip)))
+        self.ecmp_rules[(dpid, ip)] = ports
+
+    def send_ecmp_flow_delete(self, dpid, ip):
+        ports = self.ecmp_rules.pop((dpid, ip))
+        dp = self.network_awareness.switch_info.get(dpid)
+        if dp is not None:
+            match = dp.ofproto_parser.OFPMatch(eth_type=ether_types.ETH_TYPE_IP, ipv4_dst=ip)
+            self.network_awareness.pipeline.delete(dp, FORWARD_TABLE, match, 1)
+        self._release_ports(dpid, ports)
+
+    def table_occupancy(self):
+        return occupancy(dpid for dpid, ip in self.ecmp_rules)
@@ -0,0 +1,89 @@
+import networkx as nx
+
+
+# (dpid, next dpid, backup dpid) of every switch a packet along switch_path may cross:
+# the switches of the path, where the backup leads around the link to the next switch,
+# then the switches only the backups use, with no backup of their own. Those switches
+# forward along one tree into the egress that avoids every switch of the path, so a
+# packet sent around a failed link never comes back upstream of it and every switch
+# has a single next hop whichever backup brought the packet there
+def failover_hops(graph, switch_path):
+    egress = switch_path[-1]
+    position = dict((dpid, i) for i, dpid in enumerate(switch_path))
+    detour = graph.subgraph([node for node in graph if node not in position or node == egress])
+    # egress: path to it from every switch off the path
+    tree = nx.single_source_shortest_path(detour, egress)
+    hops = []
+    used = set()
+    for i, dpid in enumerate(switch_path):
+        next_dpid = switch_path[i + 1] if i + 1 < len(switch_path) else None
+        backup = None
+        if next_dpid is not None:
+            best = None
+            for nbr in graph[dpid]:
+                if nbr == next_dpid:
+                    continue
+                if nbr in position and nbr != egress:
+                    # a switch further down the path carries on along the path
+                    if position[nbr] <= i + 1:
+                        continue
+                    length = len(switch_path) - position[nbr]
+                elif nbr in tree:
+                    length = len(tree[nbr])
+                else:
+                    continue
+                if best is None or (length, nbr) < best:
+                    best = (length, nbr)
+            if best is not None:
+                backup = best[1]
+                if backup not in position:
+                    used.update(tree[backup][1:])
+        hops.append((dpid, next_dpid, backup))
+    for dpid in sorted(used, key=lambda node: len(tree[node])):
+        hops.append((dpid, tree[dpid][-2], None))
+    return hops
+
+
+# switches a packet from the ingress visits with the link (u, v) down, and whether it got out
+# of the egress; a switch whose next hop is down falls over to its backup if it has one
+def walk(hops, failed):
+    rules = dict((dpid, (next_dpid, backup)) for dpid, next_dpid, backup in hops)
+    dpid = hops[0][0]
+    visited = []
+    while dpid not in visited:
+        visited.append(dpid)
+        next_dpid, backup = rules[dpid]
+        if next_dpid is None:
+            return visited, True
+        if frozenset((dpid, next_dpid)) == failed:
+            next_dpid = backup
+        if next_dpid is None or frozenset((dpid, next_dpid)) == failed:
+            return visited, False
+        dpid = next_dpid
+    return visited + [dpid], False
+
+
+if __name__ == '__main__':
+    # python failover.py: every single link failure on the path of every pair of switches,
+    # none may loop; the rest is either delivered or dropped for lack of a backup
+    from graph_engine import random_topology
+
+    for n, degree, seed in [(12, 3, 0), (25, 3, 1), (50, 4, 2)]:
+        graph = random_topology(n, degree=degree, seed=seed)
+        loops = delivered = dropped = 0
+        for src in graph:
+            for dst in graph:
+                if src == dst:
+                    continue
+                switch_path = nx.shortest_path(graph, src, dst)
+                hops = failover_hops(graph, switch_path)
+                for u, v in zip(switch_path, switch_path[1:]):
+                    visited, ok = walk(hops, frozenset((u, v)))
+                    if len(set(visited)) < len(visited):
+                        loops += 1
+                    elif ok:
+                        delivered += 1
+                    else:
+                        dropped += 1
+        print('{} switches: {} single failures, {} delivered, {} dropped, {} loops'.format(
+            n, loops + delivered + dropped, delivered, dropped, loops))
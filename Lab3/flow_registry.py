@@ -0,0 +1,124 @@
+class FlowEntry(object):
+    def __init__(self, src, dst, eth_type, weight, dpid_path, port_path, cost, now, lifetime):
+        self.src = src              # src host ip
+        self.dst = dst              # dst host ip
+        self.eth_type = eth_type
+        self.weight = weight        # link cost the path was chosen by
+        self.dpid_path = dpid_path  # h1, s1, ..., sn, h2
+        self.port_path = port_path  # (in_port, dpid, out_port) of each switch
+        self.cost = cost            # path weight when installed or last moved
+        self.installed = now        # time the path was installed or last moved
+        self.lifetime = lifetime    # hard timeout of the rules
+        self.expires = now + lifetime  # the first rule of the path times out then
+        self.rules = None           # (dpid, src, dst) of the rules matched without in_port, fast failover only
+        self.groups = []            # (dpid, group key) of the groups the rules use
+        self.vid = None             # vlan tag the rules past the ingress match on, None while untagged
+
+    # directed links the rules of the pair send out of, both ways, each one
+    # named by its (dpid, port_no) at the sending switch
+    def links(self):
+        return ([(dpid, out_port) for in_port, dpid, out_port in self.port_path] +
+                [(dpid, in_port) for in_port, dpid, out_port in self.port_path])
+
+
+class FlowRegistry(object):
+    # the paths ShortestForward installed, one per (src, dst) host pair;
+    # the rules of the pair run both ways along the same path
+    def __init__(self):
+        self.flows = {}       # (src, dst): FlowEntry
+        self.link_index = {}  # (dpid, port_no): keys of the flows sent out of the port
+
+    def __len__(self):
+        return len(self.flows)
+
+    def __iter__(self):
+        return iter(list(self.flows.values()))
+
+    def get(self, src, dst):
+        return self.flows.get((src, dst))
+
+    def add(self, src, dst, eth_type, weight, dpid_path, port_path, cost, now, lifetime):
+        self.remove(src, dst)
+        entry = FlowEntry(src, dst, eth_type, weight, dpid_path, port_path, cost, now, lifetime)
+        self.flows[(src, dst)] = entry
+        self._index(entry)
+        return entry
+
+    # refreshed: every rule of the path was sent for the move and runs a new hard timeout; rules
+    # left as they were keep theirs, and the path still breaks when the first of them times out
+    def move(self, entry, dpid_path, port_path, cost, now, refreshed=True):
+        self._unindex(entry)
+        entry.dpid_path, entry.port_path, entry.cost, entry.installed = dpid_path, port_path, cost, now
+        if refreshed:
+            entry.expires = now + entry.lifetime
+        self._index(entry)
+
+    def remove(self, src, dst):
+        entry = self.flows.pop((src, dst), None)
+        if entry is not None:
+            self._unindex(entry)
+        return entry
+
+    def _index(self, entry):
+        for link in entry.links():
+            self.link_index.setdefault(link, set()).add((entry.src, entry.dst))
+
+    def _unindex(self, entry):
+        for link in entry.links():
+            keys = self.link_index.get(link)
+            if keys is not None:
+                keys.discard((entry.src, entry.dst))
+                if not keys:
+                    del self.link_index[link]
+
+    # flows crossing the link behind the port, the rules of each flow run both
+    # ways so either end of a link gives every flow on it
+    def flows_on_link(self, dpid, port_no):
+        return [self.flows[key] for key in self.link_index.get((dpid, port_no), ())]
+
+    # forget the flows whose rules have timed out and return them
+    def expire(self, now):
+        expired = []
+        for key, entry in list(self.flows.items()):
+            if entry.expires <= now:
+                expired.append(self.remove(*key))
+        return expired
+
+
+def reverse_path(port_path):
+    return [(out_port, dpid, in_port) for in_port, dpid, out_port in reversed(port_path)]
+
+
+# rules to add and rules to delete to move one direction of a flow from old_path to new_path;
+# a rule with the same in_port is overwritten by the add, rules that did not change are left
+# alone, and the adds are listed from the egress switch back so the ingress switch moves last
+def diff_paths(old_path, new_path):
+    old = dict((dpid, (in_port, out_port)) for in_port, dpid, out_port in old_path)
+    new = dict((dpid, (in_port, out_port)) for in_port, dpid, out_port in new_path)
+    install = [(in_port, dpid, out_port) for in_port, dpid, out_port in reversed(new_path)
+               if old.get(dpid) != (in_port, out_port)]
+    remove = [(in_port, dpid, out_port) for in_port, dpid, out_port in old_path
+              if dpid not in new or new[dpid][0] != in_port]
+    return install, remove
+
+
+if __name__ == '__main__':
+    # python flow_registry.py: flows touched by one link failure on a 25 switch
+    # network with a host on every switch and a flow between every pair of hosts
+    import networkx as nx
+    from graph_engine import random_topology
+
+    graph = random_topology(25, degree=3)
+    registry = FlowRegistry()
+    for src in graph.nodes:
+        for dst in graph.nodes:
+            if src < dst:
+                path = nx.dijkstra_path(graph, src, dst, weight='delay')
+                dpid_path = ['h%d' % src] + path + ['h%d' % dst]
+                # port of a switch towards a neighbour is the neighbour dpid, towards its host 0
+                port_path = [(dpid_path[i - 1] if i > 1 else 0, dpid_path[i],
+                              dpid_path[i + 1] if i < len(path) else 0) for i in range(1, len(path) + 1)]
+                registry.add(dpid_path[0], dpid_path[-1], 0x0800, 'delay', dpid_path, port_path, 0, 0, 30)
+    affected = [len(registry.flows_on_link(u, v)) for u, v in graph.edges]
+    print('{} flows, one link down: flush all {} flows, indexed {:.1f} on average, {} at most'.format(
+        len(registry), len(registry), float(sum(affected)) / len(affected), max(affected)))
@@ -0,0 +1,209 @@
+import array
+import heapq
+import time
+
+import numpy as np
+
+from link_cost import ATTRS, DEFAULTS, evaluate
+
+INF = float('inf')
+
+
+class CSRGraph(object):
+    # switch graph kept as integer-indexed CSR arrays:
+    # the neighbours of node i are indices[indptr[i]:indptr[i + 1]] and the
+    # attributes of each of those edges sit at the same offset in attrs[name];
+    # the cost of every edge under a link_cost function is derived from attrs
+    # on first use and kept in weights[name]
+    def __init__(self, graph, version=0, attrs=ATTRS):
+        self.version = version  # topo_version of NetworkAwareness this graph was built from
+        self.nodes = list(graph.nodes)  # index: dpid or host ip
+        self.index = dict((node, i) for i, node in enumerate(self.nodes))  # dpid or host ip: index
+        n = len(self.nodes)
+        m = graph.number_of_edges()
+        src = np.empty(2 * m, dtype=np.int32)
+        dst = np.empty(2 * m, dtype=np.int32)
+        values = dict((name, np.empty(2 * m, dtype=np.float64)) for name in attrs)
+        # every undirected edge is stored once in each direction
+        for k, (u, v, data) in enumerate(graph.edges(data=True)):
+            i, j = self.index[u], self.index[v]
+            src[2 * k], dst[2 * k] = i, j
+            src[2 * k + 1], dst[2 * k + 1] = j, i
+            for name in attrs:
+                values[name][2 * k] = values[name][2 * k + 1] = data.get(name, DEFAULTS.get(name, 1))
+        order = np.lexsort((dst, src))
+        self.indices = dst[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=n), out=self.indptr[1:])
+        self.attrs = dict((name, value[order]) for name, value in values.items())
+        self.weights = {}  # cost name: cost of every edge
+        # typed copies the dijkstra inner loop indexes, built on first use: reading an
+        # array.array is cheaper than reading numpy scalars and keeps the same 4 or 8 bytes
+        # an entry, where python lists would hold an object per entry
+        self._adjacency = None
+        self._weight_lists = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    # bytes of the arrays and of the copies dijkstra reads, not of nodes and index
+    def nbytes(self):
+        copies = list(self._weight_lists.values()) + list(self._adjacency or ())
+        return self.indptr.nbytes + self.indices.nbytes + sum(
+            a.nbytes for a in list(self.attrs.values()) + list(self.weights.values())) + sum(
+            a.itemsize * len(a) for a in copies)
+
+    def _edge(self, i, j):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return start + int(np.searchsorted(self.indices[start:end], j))
+
+    # cost of every edge, one vectorized pass over attrs the first time a cost is asked for
+    def cost(self, name):
+        if name not in self.weights:
+            self.weights[name] = evaluate(name, self.attrs)
+        return self.weights[name]
+
+    def set_weight(self, u, v, name, value):
+        # change one attribute in place and recompute only its edges in every cost, no rebuild needed
+        i, j = self.index[u], self.index[v]
+        k = np.array([self._edge(i, j), self._edge(j, i)])
+        self.attrs[name][k] = value
+        edge_attrs = dict((attr, values[k]) for attr, values in self.attrs.items())
+        for cost, values in self.weights.items():
+            values[k] = evaluate(cost, edge_attrs)
+            if cost in self._weight_lists:
+                for n in k.tolist():
+                    self._weight_lists[cost][n] = float(values[n])
+
+    def _lists(self, weight):
+        if self._adjacency is None:
+            self._adjacency = (array.array('i', self.indptr.tobytes()), array.array('i', self.indices.tobytes()))
+        if weight not in self._weight_lists:
+            self._weight_lists[weight] = array.array('d', self.cost(weight).tobytes())
+        return self._adjacency[0], self._adjacency[1], self._weight_lists[weight]
+
+    def shortest_path(self, src, dst, weight='hop'):
+        # same contract as nx: list of nodes from src to dst, None if there is no path
+        if src not in self.index or dst not in self.index:
+            return None
+        source, target = self.index[src], self.index[dst]
+        indptr, indices, weights = self._lists(weight)
+        dist = [INF] * len(self.nodes)
+        prev = [-1] * len(self.nodes)
+        dist[source] = 0
+        heap = [(0, source)]
+        pop, push = heapq.heappop, heapq.heappush
+        while heap:
+            d, i = pop(heap)
+            if i == target:
+                break
+            # stale heap entry, i was already settled with a smaller distance
+            if d > dist[i]:
+                continue
+            for k in range(indptr[i], indptr[i + 1]):
+                nd = d + weights[k]
+                j = indices[k]
+                if nd < dist[j]:
+                    dist[j] = nd
+                    prev[j] = i
+                    push(heap, (nd, j))
+        if dist[target] == INF:
+            return None
+        path = []
+        i = target
+        while i != -1:
+            path.append(self.nodes[i])
+            i = prev[i]
+        path.reverse()
+        return path
+
+
+class RouteTable(object):
+    # all-pairs distance and next-hop matrices over the nodes of a CSRGraph
+    def __init__(self, graph, weight='hop', pause=None, version=None):
+        # topo_version of NetworkAwareness, or the version of the cost, this table was built from
+        self.version = graph.version if version is None else version
+        self.weight = weight
+        self.nodes = graph.nodes
+        self.index = graph.index
+        self.dist, self.next_hop = floyd_warshall(graph, weight, pause)
+        self.complete = self.dist is not None  # False if pause gave up on the build
+
+    def path(self, src, dst):
+        if src not in self.index or dst not in self.index:
+            return None
+        i, j = self.index[src], self.index[dst]
+        if self.next_hop[i, j] < 0:
+            return None
+        path = [src]
+        while i != j:
+            i = self.next_hop[i, j]
+            path.append(self.nodes[i])
+        return path
+
+
+def floyd_warshall(graph, weight='hop', pause=None):
+    # vectorized floyd-warshall: one n x n numpy pass per intermediate node,
+    # pause() is called after each pass so a greenthread caller can yield, and
+    # gives up on the build, returning (None, None), when it returns False
+    n = len(graph)
+    dist = np.full((n, n), INF)
+    next_hop = np.full((n, n), -1, dtype=np.int32)
+    rows = np.repeat(np.arange(n, dtype=np.int32), np.diff(graph.indptr))
+    dist[rows, graph.indices] = graph.cost(weight)
+    next_hop[rows, graph.indices] = graph.indices
+    np.fill_diagonal(dist, 0)
+    np.fill_diagonal(next_hop, np.arange(n, dtype=np.int32))
+    for k in range(n):
+        via = dist[:, k, None] + dist[None, k, :]
+        better = via < dist
+        dist[better] = via[better]
+        next_hop[better] = np.broadcast_to(next_hop[:, k, None], (n, n))[better]
+        if pause is not None and pause() is False:
+            return None, None
+    return dist, next_hop
+
+
+def random_topology(n, degree=4, seed=1):
+    # connected random graph shaped like topo_map: a ring plus random chords
+    import networkx as nx
+    rng = np.random.RandomState(seed)
+    graph = nx.Graph()
+    for i in range(1, n + 1):
+        graph.add_edge(i, i % n + 1, hop=1, delay=float(rng.randint(1, 50)), is_host=False)
+    for _ in range(n * (degree - 2) // 2):
+        u, v = rng.randint(1, n + 1, size=2)
+        if u != v:
+            graph.add_edge(int(u), int(v), hop=1, delay=float(rng.randint(1, 50)), is_host=False)
+    return graph
+
+
+if __name__ == '__main__':
+    # python graph_engine.py: compare memory and dijkstra time against networkx; the
+    # memory of CSRGraph is everything allocated by the build and a first query, that is
+    # the arrays, the copies dijkstra reads, nodes and index
+    import tracemalloc
+    import networkx as nx
+
+    for n in [1000, 5000]:
+        tracemalloc.start()
+        graph = random_topology(n)
+        nx_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        csr = CSRGraph(graph)
+        csr.shortest_path(1, 2, 'delay')
+        csr_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        rng = np.random.RandomState(2)
+        pairs = [tuple(int(x) for x in rng.randint(1, n + 1, size=2)) for _ in range(50)]
+        start = time.time()
+        for s, t in pairs:
+            nx.dijkstra_path(graph, s, t, weight='delay')
+        nx_time = time.time() - start
+        start = time.time()
+        for s, t in pairs:
+            csr.shortest_path(s, t, 'delay')
+        csr_time = time.time() - start
+        print('{} switches: networkx {:.1f} KiB {:.2f} ms/path, csr {:.1f} KiB {:.2f} ms/path'.format(
+            n, nx_bytes / 1024, nx_time * 1000 / len(pairs), csr_bytes / 1024, csr_time * 1000 / len(pairs)))
@@ -0,0 +1,49 @@
+GROUP_ID_MAX = 0xffffff00  # OFPG_MAX, ids above are reserved
+
+
+class GroupTable(object):
+    # group ids of every datapath: flows that need the same group on a switch
+    # share it, and the id is freed when the last of them releases it
+    def __init__(self):
+        self.groups = {}   # (dpid, key): [group_id, number of flows using it]
+        self.keys = {}     # (dpid, group_id): key
+        self.free = {}     # dpid: released ids, reused first
+        self.next_id = {}  # dpid: next never used id
+
+    def __len__(self):
+        return len(self.groups)
+
+    # (group_id, True if the group is new and must be added to the switch)
+    def acquire(self, dpid, key):
+        group = self.groups.get((dpid, key))
+        if group is not None:
+            group[1] += 1
+            return group[0], False
+        if self.free.get(dpid):
+            group_id = self.free[dpid].pop()
+        else:
+            group_id = self.next_id.get(dpid, 1)
+            if group_id > GROUP_ID_MAX:
+                raise ValueError('no free group id on switch %s' % dpid)
+            self.next_id[dpid] = group_id + 1
+        self.groups[(dpid, key)] = [group_id, 1]
+        self.keys[(dpid, group_id)] = key
+        return group_id, True
+
+    # group_id when the last flow let go of it and it must be deleted from the switch, else None
+    def release(self, dpid, key):
+        group = self.groups.get((dpid, key))
+        if group is None:
+            return None
+        group[1] -= 1
+        if group[1] > 0:
+            return None
+        del self.groups[(dpid, key)]
+        del self.keys[(dpid, group[0])]
+        self.free.setdefault(dpid, []).append(group[0])
+        return group[0]
+
+    def get(self, dpid, key):
+        group = self.groups.get((dpid, key))
+        return group[0] if group is not None else None
+
@@ -13,6 +13,7 @@ from ryu.topology import event
 import sys
 import time
 from network_awareness import NetworkAwareness
+from pipeline import FORWARD_TABLE
 import networkx as nx
 from ryu.topology.switches import LLDPPacket
 
@@ -36,16 +37,8 @@ class ShortestForward(app_manager.RyuApp):
         self.path = None
 
     def add_flow(self, datapath, priority, match, actions, idle_timeout=0, hard_timeout=0):
-        dp = datapath
-        ofp = dp.ofproto
-        parser = dp.ofproto_parser
-        inst = [parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(
-            datapath=dp, priority=priority,
-            idle_timeout=idle_timeout,
-            hard_timeout=hard_timeout,
-            match=match, instructions=inst)
-        dp.send_msg(mod)
+        self.network_awareness.pipeline.add(datapath, FORWARD_TABLE, priority, match, actions,
+                                            idle_timeout, hard_timeout)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):
@@ -130,11 +123,7 @@ class ShortestForward(app_manager.RyuApp):
             return
         self.path = dpid_path
         # get port path:  h1 -> in_port, s1, out_port -> h2
-        port_path = []
-        for i in range(1, len(dpid_path) - 1):
-            in_port = self.network_awareness.link_info[(dpid_path[i], dpid_path[i - 1])]
-            out_port = self.network_awareness.link_info[(dpid_path[i], dpid_path[i + 1])]
-            port_path.append((in_port, dpid_path[i], out_port))
+        port_path = self.network_awareness.get_port_path(dpid_path)
         self.show_path(src_ip, dst_ip, port_path)
         # calc path delay
         # send flow mod
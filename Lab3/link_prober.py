@@ -0,0 +1,84 @@
+import struct
+
+from ryu.lib.packet import packet, ethernet
+
+from probe_stamp import now_ns, pack_stamp, unpack_stamp, STAMP, SEQ_MASK
+
+PROBE_ETHERTYPE = 0x88b5  # local experimental ethertype, never sent by hosts
+PROBE_PRIORITY = 65535    # rule on every switch sending probes to the controller
+PROBE_SRC = '02:00:00:00:88:b5'
+PROBE_DST = '01:00:00:00:88:b5'
+PROBE_BUDGET = 200        # control channel messages per second spent on probes
+PROBE_TIMEOUT = 2         # seconds before an unanswered probe counts as lost
+
+ORIGIN = struct.Struct('!QI')  # dpid and port the probe was sent out of
+PROBE_TAG = struct.pack('!H', PROBE_ETHERTYPE)
+ETHERTYPE_OFFSET = 12
+PAYLOAD_OFFSET = 14
+
+
+class LinkProber(object):
+    # one hop link delay by probe packets: the controller sends a timestamped
+    # frame out of an inter-switch port by packet-out and the neighbour returns
+    # it by a PROBE_PRIORITY rule, so every link is measured in one burst
+    # without waiting for the lldp loop of ryu.topology
+    def __init__(self, budget=PROBE_BUDGET, timeout=PROBE_TIMEOUT):
+        self.budget = budget    # messages per second, each probe costs a packet-out and a packet-in
+        self.timeout = timeout
+        self.seq = 0
+        self.cursor = 0         # first port of the next burst when the budget can not cover all ports
+        self.pending = {}       # seq: (dpid, port_no, send time in ns)
+        self.sent = 0
+        self.lost = 0
+
+    # one burst over the (dpid, port_no) ports, as many as the budget allows in interval seconds
+    def sweep(self, datapaths, ports, interval):
+        expire = now_ns() - int(self.timeout * 1e9)
+        for seq, (dpid, port_no, send_time) in list(self.pending.items()):
+            if send_time < expire:
+                del self.pending[seq]
+                self.lost += 1
+        ports = sorted(ports)
+        if not ports:
+            return
+        count = min(len(ports), max(1, int(self.budget * interval / 2)))
+        start = self.cursor % len(ports)
+        for dpid, port_no in (ports[start:] + ports[:start])[:count]:
+            datapath = datapaths.get(dpid)
+            if datapath is not None:
+                self.send(datapath, port_no)
+        self.cursor = start + count
+
+    def send(self, datapath, port_no):
+        ofp = datapath.ofproto
+        parser = datapath.ofproto_parser
+        self.seq = (self.seq + 1) & SEQ_MASK
+        pkt = packet.Packet()
+        pkt.add_protocol(ethernet.ethernet(dst=PROBE_DST, src=PROBE_SRC, ethertype=PROBE_ETHERTYPE))
+        pkt.add_protocol(ORIGIN.pack(datapath.id, port_no))
+        pkt.serialize()
+        send_time = now_ns()
+        data = pkt.data + pack_stamp(self.seq, send_time)
+        actions = [parser.OFPActionOutput(port_no)]
+        out = parser.OFPPacketOut(datapath=datapath, buffer_id=ofp.OFP_NO_BUFFER,
+                                  in_port=ofp.OFPP_CONTROLLER, actions=actions, data=data)
+        self.pending[self.seq] = (datapath.id, port_no, send_time)
+        datapath.send_msg(out)
+        self.sent += 1
+
+    @staticmethod
+    def is_probe(data):
+        return data[ETHERTYPE_OFFSET:PAYLOAD_OFFSET] == PROBE_TAG
+
+    # (src dpid, src port_no, seconds from packet-out to packet-in) of a probe, None if it is unknown
+    def reply(self, msg):
+        recv_time = now_ns()
+        data = msg.data
+        if len(data) < PAYLOAD_OFFSET + ORIGIN.size + STAMP.size:
+            return None
+        dpid, port_no = ORIGIN.unpack_from(data, PAYLOAD_OFFSET)
+        send_time, seq = unpack_stamp(data[PAYLOAD_OFFSET + ORIGIN.size:])
+        pending = self.pending.pop(seq, None)
+        if pending is None or pending != (dpid, port_no, send_time):
+            return None
+        return dpid, port_no, (recv_time - send_time) / 1e9
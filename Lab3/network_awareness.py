@@ -11,12 +11,21 @@ from ryu.topology import event
 from ryu.topology.api import get_host, get_link, get_switch
 from ryu.topology.switches import LLDPPacket
 import networkx as nx
+import itertools
+from graph_engine import CSRGraph, RouteTable
+from path_cache import PathCache
+from dynamic_sssp import DynamicSSSP
+from echo_prober import EchoProber
+from link_prober import LinkProber, PROBE_ETHERTYPE, PROBE_PRIORITY
+from pipeline import Pipeline, CLASSIFY_TABLE
+from delay_stats import DelaySeries
+from link_cost import COSTS, DEFAULTS, DEPENDS, edge_cost
 import copy
-import time
 
 GET_TOPOLOGY_INTERVAL = 2
 SEND_ECHO_REQUEST_INTERVAL = .05
 GET_DELAY_INTERVAL = 2
+ROUTE_TABLE_DELAY = .5  # wait for a burst of topology changes to settle before rebuilding route tables
 
 
 class NetworkAwareness(app_manager.RyuApp):
@@ -28,30 +37,39 @@ class NetworkAwareness(app_manager.RyuApp):
         self.link_info = {}  # (s1, s2): s1.port
         self.port_link = {}  # s1,port:s1,s2
         self.port_info = {}  # dpid: (ports linked hosts)
-        self.topo_map = nx.Graph()
-        self.topo_thread = hub.spawn(self._get_topology)
+        self.host_ip = {}    # host ipv4: (dpid, port) the host is linked to
+        self.host_mac = {}   # host mac: (dpid, port) the host is linked to
+        self.topo_map = nx.Graph()  # switches only, hosts are looked up in host_ip
         self.weight = 'delay' # change the weight from hop to delay
-        self.lldp_delay = {}  # save the lldp_delay
-        self.echo_delay = {}  # save the echo_delay
+        self.lldp_delay = {}  # save the lldp_delay, delay_stat of lldp_series
+        self.echo_delay = {}  # save the echo_delay, delay_stat of echo_series
+        self.lldp_series = DelaySeries()  # (src, dst): recent lldp_delay samples
+        self.echo_series = DelaySeries()  # dpid: recent echo_delay samples
+        self.probe_delay = {}  # (src, dst): delay_stat of probe_series
+        self.probe_series = DelaySeries()  # (src, dst): recent packet-out to packet-in times of link probes
+        self.delay_source = 'probe'  # link delay from 'probe' packets, or from 'lldp' as before
+        self.delay_stat = 'p50'  # statistic of the samples used as delay, one of delay_stats.STATS
         self.delay = {}       # save the total delay
+        self.link_load = {}   # (s1, s2): (utilization, available_bw) of s1 -> s2, see PortMonitor
         self.switches = None  # the instance of running switches
-
-    def add_flow(self, datapath, priority, match, actions):
-        dp = datapath
-        ofp = dp.ofproto
-        parser = dp.ofproto_parser
-        inst = [parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(datapath=dp, priority=priority, match=match, instructions=inst)
-        dp.send_msg(mod)
-
-    # Task 2: delete flow
-    def delete_flow(self, datapath, match):
-        ofp = datapath.ofproto
-        parser = datapath.ofproto_parser
-        inst = []
-        del_mod = parser.OFPFlowMod(datapath, 0, 0, 0, ofp.OFPFC_DELETE, 0, 0, 0, ofp.OFP_NO_BUFFER,
-                                     ofp.OFPP_ANY, ofp.OFPG_ANY, ofp.OFPFF_SEND_FLOW_REM, match, inst)
-        datapath.send_msg(del_mod)
+        self.echo_prober = EchoProber()  # echo to every switch at once, replies matched by xid
+        self.link_prober = LinkProber()  # probe packets over every link at once
+        self.pipeline = Pipeline()       # tables of every switch, the apps add their rules through it
+        self.event_driven = True  # maintain topo_map from ryu.topology events instead of polling
+        self.pending_hosts = {}   # mac: host, hosts found before their ip is learned
+        self.topo_version = 0     # bumped on every change of topo_map
+        self.struct_version = 0   # bumped when a switch or a link comes or goes
+        self.attr_versions = {}   # link attribute: bumped when it changes on any link
+        self.topo_hash = 0        # xor of the hashes of every link and delay in topo_map
+        self.graph_engine = 'networkx'  # or 'csr' to run path computation on CSRGraph
+        self.csr_graph = None           # CSRGraph built from topo_map, rebuilt when topology change
+        self.path_cache = PathCache()   # (src, dst, weight): dpid_path and port_path
+        self.route_weights = set()      # weights asked for by get_path, each gets a route table
+        self.route_tables = {}          # weight: RouteTable of switch to switch paths, swapped as a whole
+        self.route_event = hub.Event()  # set when topology change and the route tables are stale
+        self.delay_trees = {}           # source dpid: DynamicSSSP by delay, repaired on each delay change
+        self.topo_thread = hub.spawn(self._get_topology)
+        self.route_thread = hub.spawn(self._build_route_tables)
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
     def switch_features_handler(self, ev):
@@ -59,9 +77,10 @@ class NetworkAwareness(app_manager.RyuApp):
         dp = msg.datapath
         ofp = dp.ofproto
         parser = dp.ofproto_parser
-        match = parser.OFPMatch()
+        self.pipeline.install(dp)
+        # probes from a neighbour come back to the controller before any other rule
         actions = [parser.OFPActionOutput(ofp.OFPP_CONTROLLER, ofp.OFPCML_NO_BUFFER)]
-        self.add_flow(dp, 0, match, actions)
+        self.pipeline.add(dp, CLASSIFY_TABLE, PROBE_PRIORITY, parser.OFPMatch(eth_type=PROBE_ETHERTYPE), actions)
 
     # Task 2: change port status  when links down or up
     @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
@@ -72,11 +91,13 @@ class NetworkAwareness(app_manager.RyuApp):
         parser = datapath.ofproto_parser
         if msg.reason in [ofproto.OFPPR_ADD, ofproto.OFPPR_MODIFY]:
             datapath.ports[msg.desc.port_no] = msg.desc
-            self.topo_map.clear()
-            for dpid in self.port_info.keys():
-                for port in self.port_info[dpid]:
-                    match = parser.OFPMatch(in_port=port)
-                    self.delete_flow(self.switch_info[dpid], match)
+            # in event driven mode the link events keep topo_map right, the polling
+            # loop adds the link back once it is up again; the flows crossing the
+            # port are rerouted by ShortestForward
+            down = msg.desc.state & ofproto.OFPPS_LINK_DOWN or msg.desc.config & ofproto.OFPPC_PORT_DOWN
+            link = self.port_link.get((datapath.id, msg.desc.port_no))
+            if not self.event_driven and down and link is not None:
+                self._remove_link(*link)
         elif msg.reason == ofproto.OFPPR_DELETE:
             datapath.ports.pop(msg.desc.port_no, None)
         else:
@@ -100,100 +121,482 @@ class NetworkAwareness(app_manager.RyuApp):
         ofp = dp.ofproto
         parser = dp.ofproto_parser
         dpid = dp.id
+        if LinkProber.is_probe(msg.data):
+            probe = self.link_prober.reply(msg)
+            if probe is not None and self.port_link.get(probe[:2]) == (probe[0], dpid):
+                self.probe_series.add((probe[0], dpid), probe[2] * 1000)
+            return
         # try to get lldp_delay through switches
         try:
             src_dpid, src_port_no = LLDPPacket.lldp_parse(msg.data)
+        except LLDPPacket.LLDPUnknownFormat:
+            self._learn_arp(msg)
+            return
+        try:
             if self.switches is None:
                 self.switches = lookup_service_brick('switches') # look up running switch instance
-            for port in self.switches.ports.keys():
-                if src_dpid == port.dpid and src_port_no == port.port_no:
-                    self.lldp_delay[(src_dpid, dpid)] = self.switches.ports[port].delay * 1000
-                    # save the lldp_delay to the dictionary
-                    # the delay in Python is calc with the unit "second", in order to change to "ms", need to multiply 1000
+            port_data = self.switches.get_port_data(src_dpid, src_port_no)
+            if port_data is not None:
+                self.lldp_series.add((src_dpid, dpid), port_data.delay * 1000)
+                # save the lldp_delay sample to the ring buffer of the link
+                # the delay in Python is calc with the unit "second", in order to change to "ms", need to multiply 1000
         except:
             return
-        
+
+    # learn where hosts are from the arp packets sent by host-facing ports
+    def _learn_arp(self, msg):
+        in_port = msg.match['in_port']
+        if (msg.datapath.id, in_port) in self.port_link:
+            return
+        arp_pkt = packet.Packet(msg.data).get_protocol(arp.arp)
+        if arp_pkt is None:
+            return
+        self._learn_host(arp_pkt.src_mac, arp_pkt.src_ip, msg.datapath.id, in_port)
+
     # send echo_request to switches
-    def send_echo_request(self, switch):
-        datapath = switch.dp
-        parser = datapath.ofproto_parser
-        echo_req = parser.OFPEchoRequest(datapath, data=bytes(("%.12f" % time.time()).encode())) # need to encode
-        datapath.send_msg(echo_req)
+    def send_echo_request(self, datapath):
+        self.echo_prober.send(datapath)
 
     # handle the echo_reply send by switches
     @set_ev_cls(ofp_event.EventOFPEchoReply, [MAIN_DISPATCHER, CONFIG_DISPATCHER, HANDSHAKE_DISPATCHER])
     def echo_reply_handler(self, ev):
-        now_timestamp = time.time() # record the time
-        try:
-            echo_delay = now_timestamp - eval(ev.msg.data) # calc the echo_delay
-            self.echo_delay[ev.msg.datapath.id] = echo_delay * 1000 # save the echo_delay to the dictionary, also * 1000
-        except:
+        echo_delay = self.echo_prober.reply(ev.msg) # calc the echo_delay
+        if echo_delay is not None:
+            self.echo_series.add(ev.msg.datapath.id, echo_delay * 1000) # save the echo_delay sample, also * 1000
+
+    # Task 3: keep topo_map up to date from topology events
+    @set_ev_cls(event.EventSwitchEnter)
+    def switch_enter_handler(self, ev):
+        if not self.event_driven:
+            return
+        dpid = ev.switch.dp.id
+        self._add_switch(dpid)
+        self.port_info.setdefault(dpid, set())
+        for port in ev.switch.ports:
+            # ports already seen in a link are not linked to hosts
+            if (dpid, port.port_no) not in self.port_link:
+                self.port_info[dpid].add(port.port_no)
+
+    @set_ev_cls(event.EventSwitchLeave)
+    def switch_leave_handler(self, ev):
+        if not self.event_driven:
+            return
+        dpid = ev.switch.dp.id
+        for ip, (host_dpid, port_no) in list(self.host_ip.items()):
+            if host_dpid == dpid:
+                self._forget_host_ip(ip)
+        for mac, (host_dpid, port_no) in list(self.host_mac.items()):
+            if host_dpid == dpid:
+                del self.host_mac[mac]
+        self.echo_series.remove(dpid)
+        if dpid in self.topo_map:
+            for node in list(self.topo_map.neighbors(dpid)):
+                self._remove_link(dpid, node)
+            self.topo_map.remove_node(dpid)
+            self._topo_changed()
+        self.port_info.pop(dpid, None)
+
+    @set_ev_cls(event.EventLinkAdd)
+    def link_add_handler(self, ev):
+        if not self.event_driven:
+            return
+        self._add_link(ev.link)
+
+    @set_ev_cls(event.EventLinkDelete)
+    def link_delete_handler(self, ev):
+        if not self.event_driven:
+            return
+        self._remove_link(ev.link.src.dpid, ev.link.dst.dpid)
+
+    @set_ev_cls(event.EventHostAdd)
+    def host_add_handler(self, ev):
+        if not self.event_driven:
+            return
+        self._add_host(ev.host)
+
+    @set_ev_cls(event.EventHostMove)
+    def host_move_handler(self, ev):
+        if not self.event_driven:
+            return
+        self._remove_host(ev.src)
+        self._add_host(ev.dst)
+
+    def _add_host(self, host):
+        self.host_mac[host.mac] = (host.port.dpid, host.port.port_no)
+        # the ip is learned after the host is found, keep it until then
+        if not host.ipv4:
+            self.pending_hosts[host.mac] = host
+            return
+        self.pending_hosts.pop(host.mac, None)
+        for ip in host.ipv4:
+            self._learn_host(host.mac, ip, host.port.dpid, host.port.port_no)
+
+    def _remove_host(self, host):
+        self.pending_hosts.pop(host.mac, None)
+        location = (host.port.dpid, host.port.port_no)
+        if self.host_mac.get(host.mac) == location:
+            del self.host_mac[host.mac]
+        for ip in host.ipv4:
+            if self.host_ip.get(ip) == location:
+                self._forget_host_ip(ip)
+
+    def _learn_host(self, mac, ip, dpid, port_no):
+        location = (dpid, port_no)
+        self.host_mac[mac] = location
+        old_location = self.host_ip.get(ip)
+        if old_location == location:
+            return
+        if old_location is not None:
+            self._forget_host_ip(ip)
+        self.host_ip[ip] = location
+
+    def _forget_host_ip(self, ip):
+        dpid, port_no = self.host_ip.pop(ip)
+        self.path_cache.invalidate_link(ip, dpid)
+
+    # the switch a host is linked to, None if it is not a known host
+    def _host_switch(self, host):
+        location = self.host_ip.get(host)
+        if location is None:
+            return None
+        return location[0]
+
+    # a switch is a node of topo_map before any of its links is found, so hosts on it reach each other
+    def _add_switch(self, dpid):
+        if dpid not in self.topo_map:
+            self.topo_map.add_node(dpid)
+            self._topo_changed()
+
+    def _add_link(self, link):
+        src, dst = link.src, link.dst
+        # delete ports linked switches
+        self.port_info.setdefault(src.dpid, set()).discard(src.port_no)
+        self.port_info.setdefault(dst.dpid, set()).discard(dst.port_no)
+        # s1 -> s2: s1.port, s2 -> s1: s2.port
+        self.port_link[(src.dpid, src.port_no)] = (src.dpid, dst.dpid)
+        self.port_link[(dst.dpid, dst.port_no)] = (dst.dpid, src.dpid)
+        self.link_info[(src.dpid, dst.dpid)] = src.port_no
+        self.link_info[(dst.dpid, src.dpid)] = dst.port_no
+        if not self.topo_map.has_edge(src.dpid, dst.dpid):
+            self.topo_map.add_edge(src.dpid, dst.dpid, hop=1, delay=0, is_host=False)
+            # a new link may give a shorter path to anyone
+            self.path_cache.clear()
+            self._topo_changed(('link', frozenset((src.dpid, dst.dpid))), ('delay', frozenset((src.dpid, dst.dpid)), 0))
+        self._set_link_delay(src.dpid, dst.dpid, self._link_delay(src.dpid, dst.dpid))
+
+    def _remove_link(self, src, dst):
+        for s1, s2 in [(src, dst), (dst, src)]:
+            port_no = self.link_info.pop((s1, s2), None)
+            if port_no is not None:
+                self.port_link.pop((s1, port_no), None)
+            self.delay.pop((s1, s2), None)
+            self.lldp_series.remove((s1, s2))
+            self.probe_series.remove((s1, s2))
+            self.link_load.pop((s1, s2), None)
+        if self.topo_map.has_edge(src, dst):
+            edge = frozenset((src, dst))
+            weights = [(name, edge, value) for name, value in self.topo_map.edges[src, dst].items()
+                       if name not in ('hop', 'is_host')]
+            self.topo_map.remove_edge(src, dst)
+            self.path_cache.invalidate_link(src, dst)
+            self._topo_changed(('link', edge), *weights)
+
+    def _set_link_delay(self, src, dst, delay):
+        # save the whole delay to the dictionary
+        self.delay[(src, dst)] = delay
+        self._set_link_weight(src, dst, 'delay', delay)
+
+    # utilization and available_bw of the link that leaves dpid by port_no, both
+    # directions of a link share one edge so it gets the busier one
+    def set_link_load(self, dpid, port_no, utilization, available_bw):
+        if (dpid, port_no) not in self.port_link:
+            return
+        src, dst = self.port_link[(dpid, port_no)]
+        if not self.topo_map.has_edge(src, dst):
             return
+        self.link_load[(src, dst)] = (utilization, available_bw)
+        reverse = self.link_load.get((dst, src), (0, available_bw))
+        self._set_link_weight(src, dst, 'utilization', max(utilization, reverse[0]))
+        self._set_link_weight(src, dst, 'available_bw', min(available_bw, reverse[1]))
+
+    # set one of link_cost.ATTRS, e.g. loss or admin, on the link between two switches
+    def set_link_attr(self, src, dst, name, value):
+        if self.topo_map.has_edge(src, dst):
+            self._set_link_weight(src, dst, name, value)
+
+    def _set_link_weight(self, src, dst, name, value):
+        edge_data = self.topo_map.edges[src, dst]
+        old_value = edge_data.get(name)
+        if value == old_value:
+            return
+        old_data = dict(edge_data)
+        edge_data[name] = value
+        edge = frozenset((src, dst))
+        if old_value is None:
+            items = [(name, edge, value)]
+            old_value = DEFAULTS.get(name, 0)
+        else:
+            items = [(name, edge, old_value), (name, edge, value)]
+        # every cost paths were cached for may be built on this attribute
+        for weight in self.route_weights:
+            self.path_cache.update_weight(src, dst, weight, edge_cost(weight, old_data), edge_cost(weight, edge_data))
+        csr_fresh = self.csr_graph is not None and not self.changed_since(self.csr_graph.version)
+        fresh_trees = [tree for tree in self.delay_trees.values() if not self.changed_since(tree.version)]
+        self._topo_changed(*items)
+        # a new weight does not change the structure, patch csr_graph and repair the delay trees in place
+        if csr_fresh:
+            if name in self.csr_graph.attrs:
+                self.csr_graph.set_weight(src, dst, name, value)
+            self.csr_graph.version = self.topo_version
+        for tree in fresh_trees:
+            if name == tree.weight:
+                tree.update_edge(src, dst, old_value)
+            tree.version = self.topo_version
+
+    # every change of topo_map goes through here, so "has anything changed since
+    # version N" is a single compare and the hash identifies the current topology
+    def _topo_changed(self, *items):
+        self.topo_version += 1
+        # items are ('link', edge) or (attribute, edge, value), no item is a switch
+        if not items or any(item[0] == 'link' for item in items):
+            self.struct_version += 1
+        for item in items:
+            self.topo_hash ^= hash(item)
+            if item[0] != 'link':
+                self.attr_versions[item[0]] = self.attr_versions.get(item[0], 0) + 1
+        self.route_event.set()
+
+    # changes only when the switches, the links or an attribute the cost reads change
+    def cost_version(self, weight):
+        return self.struct_version, tuple(self.attr_versions.get(attr, 0) for attr in DEPENDS[weight])
+
+    def changed_since(self, version):
+        return self.topo_version != version
+
+    # one robust value per link and per switch from the recent samples, a single noisy
+    # measurement no longer flips the delay of a link
+    def _update_delay_stats(self):
+        self.lldp_delay = self.lldp_series.stat(self.delay_stat)
+        self.echo_delay = self.echo_series.stat(self.delay_stat)
+        self.probe_delay = self.probe_series.stat(self.delay_stat)
+
+    def _link_delay(self, src, dst):
+        # define values to calc the entire delay
+        lldp_delay1 = self.lldp_delay.get((src, dst), 0)
+        lldp_delay2 = self.lldp_delay.get((dst, src), 0)
+        # a probe measures controller -> src -> dst -> controller directly, use it once both ways are seen
+        if self.delay_source == 'probe' and (src, dst) in self.probe_delay and (dst, src) in self.probe_delay:
+            lldp_delay1 = self.probe_delay[(src, dst)]
+            lldp_delay2 = self.probe_delay[(dst, src)]
+        echo_delay1 = self.echo_delay.get(src, 0)
+        echo_delay2 = self.echo_delay.get(dst, 0)
+        # calc to whole delay
+        delay = (lldp_delay1 + lldp_delay2 - echo_delay1 - echo_delay2) / 2
+        # delay is supposed to be bigger than 0, if less than 0, set it to 0
+        return max(delay, 0)
+
+    def _refresh_topology(self):
+        for mac, host in list(self.pending_hosts.items()):
+            if host.ipv4:
+                self._add_host(host)
+        # links only change by events, the loop just keeps the delay fresh
+        if self.weight != 'delay':
+            return
+        self.echo_prober.sweep(self.switch_info.values())
+        self._send_probes()
+        self._update_delay_stats()
+        version = self.topo_version
+        for src, dst in list(self.topo_map.edges):
+            self._set_link_delay(src, dst, self._link_delay(src, dst))
+        if self.changed_since(version):
+            self.show_topo_map()
+
+    def _send_probes(self):
+        if self.delay_source != 'probe':
+            return
+        ports = [(s1, port_no) for (s1, s2), port_no in self.link_info.items()]
+        self.link_prober.sweep(self.switch_info, ports, GET_TOPOLOGY_INTERVAL)
 
     def _get_topology(self):
-        _hosts, _switches, _links = None, None, None
         while True:
+            if self.event_driven:
+                self._refresh_topology()
+                hub.sleep(GET_TOPOLOGY_INTERVAL)
+                continue
             hosts = get_host(self)
             switches = get_switch(self)
             links = get_link(self)
-            # update topo_map when topology change
-            if [str(x) for x in hosts] == _hosts and [str(x) for x in switches] == _switches and [str(x) for x in links] == _links:
-                continue
-            _hosts, _switches, _links = [str(x) for x in hosts], [str(x) for x in switches], [str(x) for x in links]
+            # the helpers only bump topo_version when something really changed
+            version = self.topo_version
             for switch in switches:
+                self._add_switch(switch.dp.id)
                 self.port_info.setdefault(switch.dp.id, set())
                 # record all ports
                 for port in switch.ports:
-                    self.port_info[switch.dp.id].add(port.port_no)
-                self.send_echo_request(switch)
-                hub.sleep(0.5)
+                    if (switch.dp.id, port.port_no) not in self.port_link:
+                        self.port_info[switch.dp.id].add(port.port_no)
             for host in hosts:
-                # take one ipv4 address as host id
                 if host.ipv4:
-                    self.link_info[(host.port.dpid, host.ipv4[0])] = host.port.port_no
-                    self.topo_map.add_edge(host.ipv4[0], host.port.dpid, hop=1, delay=0, is_host=True)
+                    self._add_host(host)
+            self._update_delay_stats()
             for link in links:
-                # delete ports linked switches
-                self.port_info[link.src.dpid].discard(link.src.port_no)
-                self.port_info[link.dst.dpid].discard(link.dst.port_no)
-                # s1 -> s2: s1.port, s2 -> s1: s2.port
-                self.port_link[(link.src.dpid, link.src.port_no)] = (link.src.dpid, link.dst.dpid)
-                self.port_link[(link.dst.dpid, link.dst.port_no)] = (link.dst.dpid, link.src.dpid)
-                self.link_info[(link.src.dpid, link.dst.dpid)] = link.src.port_no
-                self.link_info[(link.dst.dpid, link.src.dpid)] = link.dst.port_no
-                # define values to calc the entire delay
-                lldp_delay1 = 0
-                lldp_delay2 = 0
-                echo_delay1 = 0
-                echo_delay2 = 0
-                if (link.src.dpid, link.dst.dpid) in self.lldp_delay:
-                    lldp_delay1 = self.lldp_delay[(link.src.dpid, link.dst.dpid)]
-                if (link.dst.dpid, link.src.dpid) in self.lldp_delay:
-                    lldp_delay2 = self.lldp_delay[(link.dst.dpid, link.src.dpid)]
-                if link.src.dpid in self.echo_delay:
-                    echo_delay1 = self.echo_delay[(link.src.dpid)]
-                if link.dst.dpid in self.echo_delay:
-                    echo_delay2 = self.echo_delay[(link.dst.dpid)]
-                # calc to whole delay
-                delay = (lldp_delay1 + lldp_delay2 -echo_delay1 - echo_delay2) / 2
-                # delay is supposed to be bigger than 0, if less than 0, set it to 0
-                if delay < 0:
-                    delay = 0
-                # save the whole delay to the dictionary
-                self.delay[(link.src.dpid, link.dst.dpid)] = delay
-                # add edge to topo map
-                self.topo_map.add_edge(link.src.dpid, link.dst.dpid, hop=1, delay=delay, is_host=False)
-            if self.weight == 'delay':
-                self.show_topo_map()
+                self._add_link(link)
+            # update delay when topology change
+            if self.changed_since(version):
+                self.echo_prober.sweep([switch.dp for switch in switches])
+                self._send_probes()
+                if self.weight == 'delay':
+                    self.show_topo_map()
             hub.sleep(GET_TOPOLOGY_INTERVAL)
 
+    # precompute all pairs switch to switch paths in the background after each topology change
+    def _build_route_tables(self):
+        while True:
+            self.route_event.wait()
+            self.route_event.clear()
+            hub.sleep(ROUTE_TABLE_DELAY)
+            if self.route_event.is_set() or not self.route_weights:
+                continue
+            # only the tables whose cost changed are rebuilt, hop survives every delay or load update
+            stale = [weight for weight in list(self.route_weights) if weight not in self.route_tables or
+                     self.route_tables[weight].version != self.cost_version(weight)]
+            if not stale:
+                continue
+            # versions taken with the snapshot, nothing can change in between
+            versions = dict((weight, self.cost_version(weight)) for weight in stale)
+            graph = CSRGraph(self.topo_map, self.topo_version)
+            for weight in stale:
+                version = versions[weight]
+                # give up as soon as the table is stale, the next change wakes the loop again
+                table = RouteTable(graph, weight, version=version,
+                                   pause=lambda weight=weight, version=version:
+                                   hub.sleep(0) or self.cost_version(weight) == version)
+                if table.complete and self.cost_version(weight) == version:
+                    # publish with a single assignment, readers see either the old or the new tables
+                    route_tables = dict(self.route_tables)
+                    route_tables[weight] = table
+                    self.route_tables = route_tables
+
+    def _table_path(self, src, dst, weight):
+        table = self.route_tables.get(weight)
+        if table is None or table.version != self.cost_version(weight):
+            return None
+        src_dpid, dst_dpid = self._host_switch(src), self._host_switch(dst)
+        if src_dpid is None or dst_dpid is None:
+            return None
+        path = table.path(src_dpid, dst_dpid)
+        if path is None:
+            return None
+        return [src] + path + [dst]
+
+    def _tree_path(self, src, dst):
+        src_dpid, dst_dpid = self._host_switch(src), self._host_switch(dst)
+        if src_dpid is None or dst_dpid is None:
+            return None
+        tree = self.delay_trees.get(src_dpid)
+        # trees only survive delay changes, rebuild after any other topology change
+        if tree is None or self.changed_since(tree.version):
+            tree = DynamicSSSP(self.topo_map, src_dpid, 'delay', self.topo_version)
+            self.delay_trees[src_dpid] = tree
+        path = tree.path_to(dst_dpid)
+        if path is None:
+            return None
+        return [src] + path + [dst]
+
+    # dpid_path and port_path from src host to dst host, served from path_cache
+    # or the route tables when possible
+    def get_path(self, src, dst, weight='hop'):
+        if weight not in COSTS:
+            raise ValueError('unknown link cost %s' % weight)
+        entry = self.path_cache.get(src, dst, weight)
+        if entry is not None:
+            return entry.dpid_path, entry.port_path
+        dpid_path = self.best_path(src, dst, weight)
+        if not dpid_path:
+            return None, None
+        port_path = self.get_port_path(dpid_path)
+        self.path_cache.put(src, dst, weight, dpid_path, port_path, self.path_cost(dpid_path, weight))
+        return dpid_path, port_path
+
+    # dpid_path by the current topo_map, never from path_cache
+    def best_path(self, src, dst, weight='hop'):
+        if weight not in self.route_weights:
+            self.route_weights.add(weight)
+            self.route_event.set()
+        # on demand path is the fallback while the first route table is being built
+        dpid_path = self._table_path(src, dst, weight)
+        if dpid_path is None and weight == 'delay':
+            dpid_path = self._tree_path(src, dst)
+        if dpid_path is None:
+            dpid_path = self.shortest_path(src, dst, weight=weight)
+        return dpid_path
+
+    def get_port_path(self, dpid_path):
+        # get port path:  h1 -> in_port, s1, out_port -> h2
+        port_path = []
+        for i in range(1, len(dpid_path) - 1):
+            in_port = self._port_to(dpid_path[i], dpid_path[i - 1])
+            out_port = self._port_to(dpid_path[i], dpid_path[i + 1])
+            port_path.append((in_port, dpid_path[i], out_port))
+        return port_path
+
+    # weight of the switch part of a dpid_path now, None if one of its links is gone
+    def path_cost(self, dpid_path, weight='hop'):
+        switch_path = dpid_path[1:-1]
+        cost = 0
+        for u, v in zip(switch_path, switch_path[1:]):
+            if not self.topo_map.has_edge(u, v):
+                return None
+            cost += edge_cost(weight, self.topo_map.edges[u, v])
+        return cost
+
+    # port of dpid towards node, node is a neighbour switch or a host linked to dpid
+    def _port_to(self, dpid, node):
+        if node in self.host_ip:
+            return self.host_ip[node][1]
+        return self.link_info[(dpid, node)]
+
+    # hosts are not in topo_map, paths between hosts run between the switches they are linked to
+    def _endpoints(self, src, dst):
+        src_dpid, dst_dpid = self._host_switch(src), self._host_switch(dst)
+        head = [src] if src_dpid is not None else []
+        tail = [dst] if dst_dpid is not None else []
+        if src_dpid is None:
+            src_dpid = src
+        if dst_dpid is None:
+            dst_dpid = dst
+        return src_dpid, dst_dpid, head, tail
+
     def shortest_path(self, src, dst, weight='hop'):
-        try:
-            paths = list(nx.shortest_simple_paths(
-                self.topo_map, src, dst, weight=weight))
-            return paths[0]
-        except:
+        if self.graph_engine == 'csr':
+            if self.csr_graph is None or self.changed_since(self.csr_graph.version):
+                self.csr_graph = CSRGraph(self.topo_map, self.topo_version)
+            src_dpid, dst_dpid, head, tail = self._endpoints(src, dst)
+            path = self.csr_graph.shortest_path(src_dpid, dst_dpid, weight)
+            if path is None:
+                self.logger.info('host not find/no path')
+                return None
+            return head + path + tail
+        path = next(self.k_shortest_paths(src, dst, 1, weight), None)
+        if path is None:
             self.logger.info('host not find/no path')
+        return path
+
+    # yield the k shortest loop-free paths in order, each one computed only when asked for
+    def k_shortest_paths(self, src, dst, k=1, weight='hop'):
+        src_dpid, dst_dpid, head, tail = self._endpoints(src, dst)
+        # hop and delay are on every edge, other costs come from link_cost
+        if weight not in ('hop', 'delay'):
+            weight = lambda u, v, data, name=weight: edge_cost(name, data)
+        try:
+            if k == 1:
+                yield head + nx.dijkstra_path(self.topo_map, src_dpid, dst_dpid, weight=weight) + tail
+                return
+            for path in itertools.islice(nx.shortest_simple_paths(
+                    self.topo_map, src_dpid, dst_dpid, weight=weight), k):
+                yield head + path + tail
+        except nx.NetworkXException:
+            return
 
     def show_topo_map(self):
         self.logger.info('topo map:')
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+
+class CacheEntry(object):
+    def __init__(self, dpid_path, port_path, cost):
+        self.dpid_path = dpid_path  # h1, s1, ..., sn, h2
+        self.port_path = port_path  # (in_port, dpid, out_port) of each switch
+        self.cost = cost            # path weight when cached
+        self.current_cost = cost    # path weight after later weight changes
+
+    def links(self):
+        return [frozenset(link) for link in zip(self.dpid_path, self.dpid_path[1:])]
+
+
+class PathCache(object):
+    # bounded LRU of computed paths keyed on (src, dst, weight)
+    def __init__(self, capacity=1024, threshold=0.1):
+        self.capacity = capacity    # max number of cached paths
+        self.threshold = threshold  # relative change of path weight that drops the path
+        self.entries = OrderedDict()  # (src, dst, weight): CacheEntry, least recently used first
+        self.link_index = {}          # frozenset((node1, node2)): keys of paths crossing the link
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, src, dst, weight):
+        key = (src, dst, weight)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, src, dst, weight, dpid_path, port_path, cost):
+        key = (src, dst, weight)
+        self._remove(key)
+        entry = CacheEntry(dpid_path, port_path, cost)
+        self.entries[key] = entry
+        for link in entry.links():
+            self.link_index.setdefault(link, set()).add(key)
+        while len(self.entries) > self.capacity:
+            self._remove(next(iter(self.entries)))
+        return entry
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for link in entry.links():
+            keys = self.link_index.get(link)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.link_index[link]
+
+    # a link on the cached path went away or came back
+    def invalidate_link(self, node1, node2):
+        for key in list(self.link_index.get(frozenset((node1, node2)), ())):
+            self._remove(key)
+            self.invalidations += 1
+
+    # the weight of one link changed, drop the paths it moved too far
+    def update_weight(self, node1, node2, weight, old_value, new_value):
+        for key in list(self.link_index.get(frozenset((node1, node2)), ())):
+            if key[2] != weight:
+                continue
+            entry = self.entries[key]
+            entry.current_cost += new_value - old_value
+            if abs(entry.current_cost - entry.cost) > self.threshold * entry.cost:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+        self.link_index.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0}
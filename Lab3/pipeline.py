@@ -0,0 +1,84 @@
+ETH_TYPE_IP = 0x0800
+ETH_TYPE_ARP = 0x0806
+
+CLASSIFY_TABLE = 0  # admission: lldp and probes to the controller, arp and ipv4 on to FORWARD_TABLE
+FORWARD_TABLE = 1   # where a packet goes, the rules write their actions and go on to POLICY_TABLE
+POLICY_TABLE = 2    # may replace the actions written by FORWARD_TABLE, e.g. to steer through a waypoint
+CLASSIFY_PRIORITY = 1
+
+
+class Pipeline(object):
+    # the OF1.3 tables every switch runs a packet through, linked by goto-table:
+    # apps add their rules to a table and the pipeline builds the instructions,
+    # so a whole table can be flushed without touching the others
+    def __init__(self):
+        self.admitted = [ETH_TYPE_ARP, ETH_TYPE_IP]  # eth_types CLASSIFY_TABLE sends on to FORWARD_TABLE
+
+    # table-miss entries and the classification of a new switch; a switch that comes back,
+    # or outlived a controller restart, still has rules no app knows of, they are flushed
+    def install(self, datapath):
+        parser = datapath.ofproto_parser
+        self._add_miss(datapath, CLASSIFY_TABLE)
+        self.flush(datapath, FORWARD_TABLE)
+        self.flush(datapath, POLICY_TABLE)
+        for eth_type in self.admitted:
+            self.add(datapath, CLASSIFY_TABLE, CLASSIFY_PRIORITY, parser.OFPMatch(eth_type=eth_type), None,
+                     goto=FORWARD_TABLE)
+
+    # a miss in CLASSIFY_TABLE or FORWARD_TABLE goes straight to the controller, past any
+    # policy; a miss in POLICY_TABLE runs the actions FORWARD_TABLE wrote
+    def _add_miss(self, datapath, table):
+        ofp = datapath.ofproto
+        parser = datapath.ofproto_parser
+        inst = []
+        if table != POLICY_TABLE:
+            actions = [parser.OFPActionOutput(ofp.OFPP_CONTROLLER, ofp.OFPCML_NO_BUFFER)]
+            inst = [parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, actions)]
+        datapath.send_msg(parser.OFPFlowMod(datapath=datapath, table_id=table, priority=0,
+                                            match=parser.OFPMatch(), instructions=inst))
+
+    def instructions(self, datapath, table, actions, goto=None):
+        ofp = datapath.ofproto
+        parser = datapath.ofproto_parser
+        inst = []
+        if table == FORWARD_TABLE:
+            # written, not applied, so a policy can still replace them
+            if actions is not None:
+                inst.append(parser.OFPInstructionActions(ofp.OFPIT_WRITE_ACTIONS, actions))
+            goto = POLICY_TABLE if goto is None else goto
+        elif table == POLICY_TABLE:
+            # an empty action list drops the packet
+            if actions is not None:
+                inst.append(parser.OFPInstructionActions(ofp.OFPIT_CLEAR_ACTIONS, []))
+                inst.append(parser.OFPInstructionActions(ofp.OFPIT_WRITE_ACTIONS, actions))
+        elif actions is not None:
+            inst.append(parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, actions))
+        if goto is not None:
+            inst.append(parser.OFPInstructionGotoTable(goto))
+        return inst
+
+    def add(self, datapath, table, priority, match, actions, idle_timeout=0, hard_timeout=0, goto=None, flags=0):
+        parser = datapath.ofproto_parser
+        mod = parser.OFPFlowMod(datapath=datapath, table_id=table, priority=priority, flags=flags,
+                                idle_timeout=idle_timeout, hard_timeout=hard_timeout, match=match,
+                                instructions=self.instructions(datapath, table, actions, goto))
+        datapath.send_msg(mod)
+
+    # the rule of table with exactly this match and priority
+    def delete(self, datapath, table, match, priority):
+        ofp = datapath.ofproto
+        parser = datapath.ofproto_parser
+        mod = parser.OFPFlowMod(datapath=datapath, table_id=table, command=ofp.OFPFC_DELETE_STRICT,
+                                priority=priority, out_port=ofp.OFPP_ANY, out_group=ofp.OFPG_ANY, match=match)
+        datapath.send_msg(mod)
+
+    # every rule of FORWARD_TABLE or POLICY_TABLE in one flow-mod, the table-miss entry is put back
+    def flush(self, datapath, table):
+        if table not in (FORWARD_TABLE, POLICY_TABLE):
+            raise ValueError('table %s can not be flushed' % table)
+        ofp = datapath.ofproto
+        parser = datapath.ofproto_parser
+        mod = parser.OFPFlowMod(datapath=datapath, table_id=table, command=ofp.OFPFC_DELETE,
+                                out_port=ofp.OFPP_ANY, out_group=ofp.OFPG_ANY, match=parser.OFPMatch())
+        datapath.send_msg(mod)
+        self._add_miss(datapath, table)
@@ -0,0 +1,78 @@
+# ryu-manager shortest_forward.py port_monitor.py --observe-links
+from ryu.base import app_manager
+from ryu.ofproto import ofproto_v1_3
+from ryu.controller.handler import set_ev_cls
+from ryu.controller.handler import MAIN_DISPATCHER
+from ryu.controller import ofp_event
+from ryu.lib import hub
+from network_awareness import NetworkAwareness
+import numpy as np
+
+MONITOR_INTERVAL = 1
+LINK_CAPACITY = 10 * 10 ** 6  # bit/s of a link, the topologies use TCLink with bw=10
+
+
+class PortMonitor(app_manager.RyuApp):
+    # polls the port counters of every switch and hands the utilization and
+    # available bandwidth of each link to NetworkAwareness, which keeps them on
+    # the topo_map edges next to hop and delay
+    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+    _CONTEXTS = {
+        'network_awareness': NetworkAwareness
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(PortMonitor, self).__init__(*args, **kwargs)
+        self.network_awareness = kwargs['network_awareness']
+        self.capacity = {}     # (dpid, port_no): bit/s, links not here have LINK_CAPACITY
+        self.port_stats = {}   # dpid: (port_no, tx_bytes, rx_bytes, duration) arrays of the last reply
+        self.port_speed = {}   # (dpid, port_no): (tx, rx) in bit/s
+        self.monitor_thread = hub.spawn(self._monitor)
+
+    def _monitor(self):
+        while True:
+            for dp in list(self.network_awareness.switch_info.values()):
+                self.send_port_stats_request(dp)
+            hub.sleep(MONITOR_INTERVAL)
+
+    def send_port_stats_request(self, datapath):
+        ofp = datapath.ofproto
+        parser = datapath.ofproto_parser
+        req = parser.OFPPortStatsRequest(datapath, 0, ofp.OFPP_ANY)
+        datapath.send_msg(req)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
+    def port_stats_reply_handler(self, ev):
+        msg = ev.msg
+        dp = msg.datapath
+        dpid = dp.id
+        # the local port and the other reserved ports carry no link
+        body = [stat for stat in msg.body if stat.port_no <= dp.ofproto.OFPP_MAX]
+        if not body:
+            return
+        port_no = np.array([stat.port_no for stat in body], dtype=np.int64)
+        tx_bytes = np.array([stat.tx_bytes for stat in body], dtype=np.float64)
+        rx_bytes = np.array([stat.rx_bytes for stat in body], dtype=np.float64)
+        duration = np.array([stat.duration_sec + stat.duration_nsec / 1e9 for stat in body])
+        last = self.port_stats.get(dpid)
+        self.port_stats[dpid] = (port_no, tx_bytes, rx_bytes, duration)
+        if last is None:
+            return
+        # line the last reply up with this one, ports may come and go between replies
+        last_port_no, last_tx, last_rx, last_duration = last
+        order = np.argsort(last_port_no)
+        pos = np.clip(np.searchsorted(last_port_no, port_no, sorter=order), 0, len(order) - 1)
+        prev = order[pos]
+        period = duration - last_duration[prev]
+        # a port seen for the first time or reset since has no usable delta
+        known = (last_port_no[prev] == port_no) & (period > 0)
+        period = np.where(known, period, 1)
+        tx = np.clip((tx_bytes - last_tx[prev]) * 8 / period, 0, None)
+        rx = np.clip((rx_bytes - last_rx[prev]) * 8 / period, 0, None)
+        capacity = np.array([self.capacity.get((dpid, p), LINK_CAPACITY) for p in port_no.tolist()], dtype=np.float64)
+        utilization = np.clip(np.maximum(tx, rx) / capacity, 0, 1)
+        available_bw = capacity * (1 - utilization)
+        for p, t, r, u, a in zip(port_no[known].tolist(), tx[known].tolist(), rx[known].tolist(),
+                                 utilization[known].tolist(), available_bw[known].tolist()):
+            self.port_speed[(dpid, p)] = (t, r)
+            self.network_awareness.set_link_load(dpid, p, u, a)
@@ -0,0 +1,40 @@
+import struct
+import time
+
+# measurement payload: monotonic send time in ns and a sequence id, network order
+STAMP = struct.Struct('!QI')
+SEQ_MASK = 0xffffffff
+
+if hasattr(time, 'monotonic_ns'):
+    now_ns = time.monotonic_ns
+else:
+    def now_ns():
+        return int(time.monotonic() * 1e9)
+
+
+def pack_stamp(seq, stamp=None):
+    if stamp is None:
+        stamp = now_ns()
+    return STAMP.pack(stamp, seq & SEQ_MASK)
+
+
+# (send time in ns, seq) read in place from the payload, None if it is not a stamp
+def unpack_stamp(data):
+    if len(data) < STAMP.size:
+        return None
+    return STAMP.unpack_from(data)
+
+
+if __name__ == '__main__':
+    # python probe_stamp.py: per-reply decode cost of the old ascii payload and the struct
+    import timeit
+
+    ascii_payload = bytes(("%.12f" % time.time()).encode())
+    stamp_payload = pack_stamp(1)
+    n = 200000
+    eval_time = timeit.timeit(lambda: eval(ascii_payload), number=n)
+    float_time = timeit.timeit(lambda: float(ascii_payload), number=n)
+    struct_time = timeit.timeit(lambda: unpack_stamp(stamp_payload), number=n)
+    print('eval(ascii)        {:.0f} ns/reply'.format(eval_time * 1e9 / n))
+    print('float(ascii)       {:.0f} ns/reply'.format(float_time * 1e9 / n))
+    print('unpack_stamp()     {:.0f} ns/reply'.format(struct_time * 1e9 / n))
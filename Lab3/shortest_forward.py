@@ -10,13 +10,30 @@ from ryu.lib.packet import packet
 from ryu.lib.packet import ethernet, arp, ipv4, ether_types
 from ryu.controller import ofp_event
 from ryu.topology import event
+from ryu.lib import hub
 import sys
+import time
 from network_awareness import NetworkAwareness
+from flow_registry import FlowRegistry, diff_paths, reverse_path
+from group_table import GroupTable
+from failover import failover_hops
+from barrier import BarrierTracker
+from dest_rules import occupancy
+from pipeline import FORWARD_TABLE
 import networkx as nx
 from ryu.topology.switches import LLDPPacket
 ETHERNET = ethernet.ethernet.__name__
 ETHERNET_MULTICAST = "ff:ff:ff:ff:ff:ff"
 ARP = arp.arp.__name__
+IDLE_TIMEOUT = 10
+HARD_TIMEOUT = 30
+REOPT_INTERVAL = 5      # seconds between two passes of the re-optimizer
+REOPT_THRESHOLD = 0.2   # relative improvement of the path weight needed to move a flow
+REOPT_HOLD_DOWN = 10    # seconds a flow stays on a path before it may move again
+UPDATE_GRACE = 1        # seconds packets of the old version may still be in flight after the ingress flips
+VID_MAX = 4094
+TAGGED_PRIORITY = 2     # above the untagged rules, which also match tagged packets on the same in_port
+PROACTIVE_INTERVAL = 1  # seconds the switches, links and hosts must stay the same before all pairs are installed
 
 
 class ShortestForward(app_manager.RyuApp):
@@ -28,23 +45,28 @@ class ShortestForward(app_manager.RyuApp):
     def __init__(self, *args, **kwargs):
         super(ShortestForward, self).__init__(*args, **kwargs)
         self.network_awareness = kwargs['network_awareness']
-        self.weight = 'hop'
+        self.weight = 'hop'  # name of a cost in link_cost.COSTS, e.g. 'delay' or 'delay_util'
         self.mac_to_port = {}
         self.sw = {}
         self.path = None
+        self.flows = FlowRegistry()  # (src_ip, dst_ip): path installed for the pair
+        self.fast_failover = False   # give every hop a link-disjoint backup next hop in an OFPGT_FF group
+        self.groups = GroupTable()   # group ids of every switch, shared by the flows using them
+        self.consistent_update = True  # move flows in two phases with vlan version tags, see update_flow
+        self.barriers = BarrierTracker()  # callbacks waiting for barrier replies
+        self.vid = 0                 # last vlan tag given to a path version
+        self.counters = {'ipv4_packet_in': 0, 'flows_installed': 0,  # packet-ins beyond one per flow are duplicates
+                         'coalesced': 0}   # packet-ins queued behind a path being installed
+        self.in_flight = {}          # (src_ip, dst_ip): [start time, port_path, [(msg, last hop)]] of paths being installed
+        self.proactive = False       # install a path for every pair of known hosts before their first packet
+        self.proactive_key = None    # links and hosts seen by the last pass of _proactive
+        self.reopt_thread = hub.spawn(self._reoptimize)
+        self.proactive_thread = hub.spawn(self._proactive)
 
-    def add_flow(self, datapath, priority, match, actions, idle_timeout=0, hard_timeout=0):
-        dp = datapath
-        ofp = dp.ofproto
-        parser = dp.ofproto_parser
-
-        inst = [parser.OFPInstructionActions(ofp.OFPIT_APPLY_ACTIONS, actions)]
-        mod = parser.OFPFlowMod(
-            datapath=dp, priority=priority,
-            idle_timeout=idle_timeout,
-            hard_timeout=hard_timeout,
-            match=match, instructions=inst)
-        dp.send_msg(mod)
+    # forwarding rules go to FORWARD_TABLE, the policies of POLICY_TABLE still apply after them
+    def add_flow(self, datapath, priority, match, actions, idle_timeout=0, hard_timeout=0, flags=0):
+        self.network_awareness.pipeline.add(datapath, FORWARD_TABLE, priority, match, actions,
+                                            idle_timeout, hard_timeout, flags=flags)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):
@@ -83,6 +105,15 @@ class ShortestForward(app_manager.RyuApp):
             return
         dst = dst
         src = src
+        # known hosts get the arp straight from the switch they are linked to, no flooding
+        arp_pkt = pkt.get_protocol(arp.arp)
+        if dst == ETHERNET_MULTICAST:
+            location = self.network_awareness.host_ip.get(arp_pkt.dst_ip)
+        else:
+            location = self.network_awareness.host_mac.get(dst)
+        if location is not None:
+            self.send_to_host(msg, location)
+            return
         # just handle loop here
         # just like your code in exp1 mission2
         header_list = dict((p.protocol_name, p)
@@ -123,44 +154,479 @@ class ShortestForward(app_manager.RyuApp):
                                   in_port=in_port, actions=actions, data=msg.data)
         dp.send_msg(out)
 
+    def send_to_host(self, msg, location):
+        dpid, port_no = location
+        dp = self.network_awareness.switch_info[dpid]
+        ofp = dp.ofproto
+        parser = dp.ofproto_parser
+        actions = [parser.OFPActionOutput(port_no)]
+        out = parser.OFPPacketOut(datapath=dp, buffer_id=ofp.OFP_NO_BUFFER,
+                                  in_port=ofp.OFPP_CONTROLLER, actions=actions, data=msg.data)
+        dp.send_msg(out)
+
     def handle_ipv4(self, msg, src_ip, dst_ip, pkt_type):
         parser = msg.datapath.ofproto_parser
-        dpid_path = self.network_awareness.shortest_path(
+        self.counters['ipv4_packet_in'] += 1
+        if self.coalesce(msg, src_ip, dst_ip):
+            return
+        # get port path:  h1 -> in_port, s1, out_port -> h2
+        dpid_path, port_path = self.network_awareness.get_path(
             src_ip, dst_ip, weight=self.weight)
         if not dpid_path:
             return
         self.path = dpid_path
-        # get port path:  h1 -> in_port, s1, out_port -> h2
-        port_path = []
-        for i in range(1, len(dpid_path) - 1):
-            in_port = self.network_awareness.link_info[(
-                dpid_path[i], dpid_path[i - 1])]
-            out_port = self.network_awareness.link_info[(
-                dpid_path[i], dpid_path[i + 1])]
-            port_path.append((in_port, dpid_path[i], out_port))
         self.show_path(src_ip, dst_ip, port_path)
         # calc path delay
         # send flow mod
-        for node in port_path:
-            in_port, dpid, out_port = node
-            self.send_flow_mod(parser, dpid, pkt_type,
-                               src_ip, dst_ip, in_port, out_port)
-            self.send_flow_mod(parser, dpid, pkt_type,
-                               dst_ip, src_ip, out_port, in_port)
-        # send packet_out
-        in_port, dpid, out_port = port_path[-1]
-        dp = self.network_awareness.switch_info[dpid]
+        entry = self.install_flow(parser, src_ip, dst_ip, pkt_type, dpid_path, port_path,
+                                  self.network_awareness.path_cost(dpid_path, self.weight), time.monotonic())
+        self.counters['flows_installed'] += 1
+        # send packet_out once every switch of the path has its rules, so neither this
+        # packet nor the ones right behind it miss on a switch further down
+        dpids = set(dpid for in_port, dpid, out_port in port_path)
+        if entry.rules is not None:
+            dpids.update(dpid for dpid, a, b in entry.rules)
+        key = (src_ip, dst_ip)
+        self.in_flight[key] = [time.monotonic(), port_path, [(msg, port_path[-1])]]
+        self.barriers.wait(self._datapaths(dpids), self.release_packets, key)
+
+    # queue a packet-in behind the path of its pair, or of the reverse pair, while
+    # that one is being installed; True if it was queued
+    def coalesce(self, msg, src_ip, dst_ip):
+        now = time.monotonic()
+        for key, reverse in [((src_ip, dst_ip), False), ((dst_ip, src_ip), True)]:
+            pending = self.in_flight.get(key)
+            if pending is None:
+                continue
+            # a switch that never answered the barrier must not hold the pair forever
+            if now - pending[0] > self.barriers.timeout:
+                del self.in_flight[key]
+                continue
+            port_path = reverse_path(pending[1]) if reverse else pending[1]
+            pending[2].append((msg, port_path[-1]))
+            self.counters['coalesced'] += 1
+            return True
+        return False
+
+    # forget the pairs whose barriers were dropped, with the packets queued behind them
+    def expire_in_flight(self, now):
+        for key, pending in list(self.in_flight.items()):
+            if now - pending[0] > self.barriers.timeout:
+                del self.in_flight[key]
+
+    def release_packets(self, key):
+        pending = self.in_flight.pop(key, None)
+        if pending is not None:
+            for msg, node in pending[2]:
+                self.release_packet(msg, node)
+
+    # send the packet of a packet-in out of the last hop of its path
+    def release_packet(self, msg, node):
+        in_port, dpid, out_port = node
+        dp = self.network_awareness.switch_info.get(dpid)
+        if dp is None:
+            return
+        parser = dp.ofproto_parser
         actions = [parser.OFPActionOutput(out_port)]
         out = parser.OFPPacketOut(
             datapath=dp, buffer_id=msg.buffer_id, in_port=in_port, actions=actions, data=msg.data)
         dp.send_msg(out)
 
-    def send_flow_mod(self, parser, dpid, pkt_type, src_ip, dst_ip, in_port, out_port):
+    # install the rules of both directions of a flow and record it in flows; each direction
+    # goes from its egress switch back to its ingress, so a switch only forwards packets of
+    # the flow once every switch after it can
+    def install_flow(self, parser, src_ip, dst_ip, pkt_type, dpid_path, port_path, cost, now):
+        old = self.flows.get(src_ip, dst_ip)
+        lifetime = float('inf') if self.proactive else HARD_TIMEOUT
+        entry = self.flows.add(src_ip, dst_ip, pkt_type, self.weight, dpid_path, port_path, cost, now, lifetime)
+        if not self.fast_failover:
+            for node in reversed(port_path):
+                in_port, dpid, out_port = node
+                self.send_flow_mod(parser, dpid, pkt_type,
+                                   src_ip, dst_ip, in_port, out_port)
+            for node in port_path:
+                in_port, dpid, out_port = node
+                self.send_flow_mod(parser, dpid, pkt_type,
+                                   dst_ip, src_ip, out_port, in_port)
+        else:
+            # the backup path of a hop may cross the switch from another in_port, so the rules match on ips only
+            entry.rules = []
+            for a, b, path in [(src_ip, dst_ip, dpid_path), (dst_ip, src_ip, dpid_path[::-1])]:
+                for dpid, out_port, backup_port in reversed(self._failover_hops(path)):
+                    self.send_failover_flow_mod(entry, dpid, a, b, out_port, backup_port)
+        # a pair installed again, e.g. after its rules idled out, gives back the groups of the
+        # old path; after the new ones are taken, so groups both paths use stay on the switch
+        if old is not None:
+            self.release_groups(old)
+        return entry
+
+    # (dpid, out_port, backup_port) of every switch a packet from path[0] to path[-1] may cross,
+    # see failover.failover_hops; backup-only switches have no backup_port
+    def _failover_hops(self, path):
+        link_info = self.network_awareness.link_info
+        port_path = self.network_awareness.get_port_path(path)
+        hops = []
+        for dpid, next_dpid, backup in failover_hops(self.network_awareness.topo_map, path[1:-1]):
+            backup_port = link_info[(dpid, backup)] if backup is not None else None
+            hops.append((dpid, link_info[(dpid, next_dpid)] if next_dpid is not None else None, backup_port))
+        # the switches of the path send to the ports of port_path, the egress to the host
+        for i, (in_port, dpid, out_port) in enumerate(port_path):
+            hops[i] = (dpid, out_port, hops[i][2])
+        return hops
+
+    def send_failover_flow_mod(self, entry, dpid, src_ip, dst_ip, out_port, backup_port):
         dp = self.network_awareness.switch_info[dpid]
-        match = parser.OFPMatch(
-            in_port=in_port, eth_type=pkt_type, ipv4_src=src_ip, ipv4_dst=dst_ip)
-        actions = [parser.OFPActionOutput(out_port)]
-        self.add_flow(dp, 1, match, actions, 10, 30)
+        ofp = dp.ofproto
+        parser = dp.ofproto_parser
+        if backup_port is None:
+            actions = [parser.OFPActionOutput(out_port)]
+        else:
+            key = (ofp.OFPGT_FF, out_port, backup_port)
+            group_id, new = self.groups.acquire(dpid, key)
+            entry.groups.append((dpid, key))
+            if new:
+                # the first bucket whose port is up forwards the packet
+                buckets = [parser.OFPBucket(watch_port=port, watch_group=ofp.OFPG_ANY,
+                                            actions=[parser.OFPActionOutput(port)])
+                           for port in [out_port, backup_port]]
+                self.send_group_mod(dp, ofp.OFPGC_ADD, ofp.OFPGT_FF, group_id, buckets)
+            actions = [parser.OFPActionGroup(group_id)]
+        match = parser.OFPMatch(eth_type=entry.eth_type, ipv4_src=src_ip, ipv4_dst=dst_ip)
+        self.add_flow(dp, 1, match, actions, *self._timeouts(), flags=ofp.OFPFF_SEND_FLOW_REM)
+        entry.rules.append((dpid, src_ip, dst_ip))
+
+    def send_group_mod(self, datapath, command, group_type, group_id, buckets):
+        parser = datapath.ofproto_parser
+        datapath.send_msg(parser.OFPGroupMod(datapath, command, group_type, group_id, buckets))
+
+    # give back the groups of a flow, the ones no other flow uses are deleted from the switches
+    def release_groups(self, entry):
+        for dpid, key in entry.groups:
+            group_id = self.groups.release(dpid, key)
+            dp = self.network_awareness.switch_info.get(dpid)
+            if group_id is not None and dp is not None:
+                self.send_group_mod(dp, dp.ofproto.OFPGC_DELETE, key[0], group_id, [])
+        entry.groups = []
+
+    # vid: match packets carrying this vlan tag, push_vid: tag the packet, pop: untag it
+    def send_flow_mod(self, parser, dpid, pkt_type, src_ip, dst_ip, in_port, out_port,
+                      vid=None, push_vid=None, pop=False):
+        dp = self.network_awareness.switch_info[dpid]
+        ofp = dp.ofproto
+        match = self._ip_match(dp, pkt_type, src_ip, dst_ip, in_port, vid)
+        actions = []
+        if push_vid is not None:
+            actions += [parser.OFPActionPushVlan(ether_types.ETH_TYPE_8021Q),
+                        parser.OFPActionSetField(vlan_vid=push_vid | ofp.OFPVID_PRESENT)]
+        if pop:
+            actions.append(parser.OFPActionPopVlan())
+        actions.append(parser.OFPActionOutput(out_port))
+        priority = 1 if vid is None else TAGGED_PRIORITY
+        self.add_flow(dp, priority, match, actions, *self._timeouts(), flags=ofp.OFPFF_SEND_FLOW_REM)
+
+    # (idle_timeout, hard_timeout) of forwarding rules, each is reported by a flow-removed when
+    # it times out, see flow_removed_handler; proactive rules stay until they are moved or removed
+    def _timeouts(self):
+        if self.proactive:
+            return 0, 0
+        return IDLE_TIMEOUT, HARD_TIMEOUT
+
+    def _ip_match(self, dp, pkt_type, src_ip, dst_ip, in_port=None, vid=None):
+        fields = {'eth_type': pkt_type, 'ipv4_src': src_ip, 'ipv4_dst': dst_ip}
+        if in_port is not None:
+            fields['in_port'] = in_port
+        if vid is not None:
+            fields['vlan_vid'] = vid | dp.ofproto.OFPVID_PRESENT
+        return dp.ofproto_parser.OFPMatch(**fields)
+
+    def send_flow_delete(self, parser, dpid, pkt_type, src_ip, dst_ip, in_port=None, vid=None):
+        dp = self.network_awareness.switch_info.get(dpid)
+        if dp is None:
+            return
+        match = self._ip_match(dp, pkt_type, src_ip, dst_ip, in_port, vid)
+        self.network_awareness.pipeline.delete(dp, FORWARD_TABLE, match, 1 if vid is None else TAGGED_PRIORITY)
+
+    # move installed flows to a better path when link weights have shifted enough
+    def _reoptimize(self):
+        while True:
+            hub.sleep(REOPT_INTERVAL)
+            now = time.monotonic()
+            # rules a diff-based move sent are still up when the first rule of the path times out
+            for entry in self.flows.expire(now):
+                self.remove_flow(entry)
+            self.barriers.expire(now)
+            self.expire_in_flight(now)
+            for entry in self.flows:
+                # hold-down keeps a flow from flapping between two close paths
+                if now - entry.installed < REOPT_HOLD_DOWN:
+                    continue
+                cost = self.network_awareness.path_cost(entry.dpid_path, entry.weight)
+                dpid_path = self.network_awareness.best_path(entry.src, entry.dst, entry.weight)
+                if cost is None or not dpid_path or dpid_path == entry.dpid_path:
+                    continue
+                new_cost = self.network_awareness.path_cost(dpid_path, entry.weight)
+                if new_cost is None or new_cost > cost * (1 - REOPT_THRESHOLD):
+                    continue
+                self.move_flow(entry, dpid_path, new_cost, now)
+
+    # proactive mode: once the switches, links and hosts have stayed the same for one interval,
+    # install the pairs that have no path yet, fix the paths a link or host move broke and remove
+    # the pairs of hosts that left; better paths by weight are left to _reoptimize
+    def _proactive(self):
+        while True:
+            hub.sleep(PROACTIVE_INTERVAL)
+            if not self.proactive:
+                continue
+            hosts = dict(self.network_awareness.host_ip)
+            key = (frozenset(frozenset(edge) for edge in self.network_awareness.topo_map.edges),
+                   frozenset(hosts.items()))
+            if key != self.proactive_key:
+                # not settled yet, look again after one more interval
+                self.proactive_key = key
+                continue
+            self.refresh_pairs(hosts)
+
+    def refresh_pairs(self, hosts):
+        now = time.monotonic()
+        for entry in self.flows:
+            if entry.src not in hosts or entry.dst not in hosts:
+                self.remove_flow(entry)
+                continue
+            cost = self.network_awareness.path_cost(entry.dpid_path, entry.weight)
+            # a host that moved to another switch may have kept its port number
+            attached = (hosts[entry.src][0] == entry.dpid_path[1] and hosts[entry.dst][0] == entry.dpid_path[-2])
+            if (cost is not None and attached and
+                    self.network_awareness.get_port_path(entry.dpid_path) == entry.port_path):
+                continue
+            dpid_path = self.network_awareness.best_path(entry.src, entry.dst, entry.weight)
+            if dpid_path:
+                self.move_flow(entry, dpid_path, self.network_awareness.path_cost(dpid_path, entry.weight), now)
+            else:
+                self.remove_flow(entry)
+        ips = sorted(hosts)
+        for i, src_ip in enumerate(ips):
+            for dst_ip in ips[i + 1:]:
+                if self.flows.get(src_ip, dst_ip) is not None or self.flows.get(dst_ip, src_ip) is not None:
+                    continue
+                dpid_path, port_path = self.network_awareness.get_path(src_ip, dst_ip, weight=self.weight)
+                if not dpid_path:
+                    continue
+                dp = self.network_awareness.switch_info.get(dpid_path[1])
+                if dp is None:
+                    continue
+                self.install_flow(dp.ofproto_parser, src_ip, dst_ip, ether_types.ETH_TYPE_IP, dpid_path, port_path,
+                                  self.network_awareness.path_cost(dpid_path, self.weight), now)
+
+    # only the switches whose rules differ get a flow-mod, the ingress switch last
+    def move_flow(self, entry, dpid_path, cost, now):
+        port_path = self.network_awareness.get_port_path(dpid_path)
+        self.logger.info('reroute: {} -> {} cost {:.2f} -> {:.2f}'.format(entry.src, entry.dst, entry.cost, cost))
+        self.show_path(entry.src, entry.dst, port_path)
+        if entry.rules is not None:
+            self.move_failover_flow(entry, dpid_path, port_path, cost, now)
+            return
+        if len(port_path) > 1 and (self.consistent_update or entry.vid is not None):
+            self.update_flow(entry, dpid_path, port_path, cost, now)
+            return
+        if entry.vid is not None:
+            # the old rules match on the tag, diff_paths does not know them
+            old = [(entry.src, entry.dst, self._path_rules(entry.port_path, entry.vid)),
+                   (entry.dst, entry.src, self._path_rules(reverse_path(entry.port_path), entry.vid))]
+            new = [(entry.src, entry.dst, self._path_rules(port_path, None)),
+                   (entry.dst, entry.src, self._path_rules(reverse_path(port_path), None))]
+            for src_ip, dst_ip, rules in new:
+                for rule in reversed(rules):
+                    self._send_rule(entry.eth_type, src_ip, dst_ip, rule)
+            self._delete_old(entry.eth_type, old, new)
+            entry.vid = None
+            self.network_awareness.path_cache.put(entry.src, entry.dst, entry.weight, dpid_path, port_path, cost)
+            self.flows.move(entry, dpid_path, port_path, cost, now)
+            return
+        refreshed = True
+        for src_ip, dst_ip, old_path, new_path in [
+                (entry.src, entry.dst, entry.port_path, port_path),
+                (entry.dst, entry.src, reverse_path(entry.port_path), reverse_path(port_path))]:
+            install, remove = diff_paths(old_path, new_path)
+            refreshed = refreshed and len(install) == len(new_path)
+            for in_port, dpid, out_port in install:
+                dp = self.network_awareness.switch_info[dpid]
+                self.send_flow_mod(dp.ofproto_parser, dpid, entry.eth_type, src_ip, dst_ip, in_port, out_port)
+            for in_port, dpid, out_port in remove:
+                dp = self.network_awareness.switch_info.get(dpid)
+                if dp is not None:
+                    self.send_flow_delete(dp.ofproto_parser, dpid, entry.eth_type, src_ip, dst_ip, in_port)
+        self.network_awareness.path_cache.put(entry.src, entry.dst, entry.weight, dpid_path, port_path, cost)
+        self.flows.move(entry, dpid_path, port_path, cost, now, refreshed)
+
+    # (in_port, dpid, out_port, vid, push_vid, pop) of the rules of one direction of a path version:
+    # the ingress tags the packets with vid, the switches after it match on the tag, the egress untags
+    def _path_rules(self, port_path, vid):
+        if vid is None or len(port_path) < 2:
+            return [(in_port, dpid, out_port, None, None, False) for in_port, dpid, out_port in port_path]
+        last = len(port_path) - 1
+        return [(in_port, dpid, out_port, vid if i else None, vid if i == 0 else None, i == last)
+                for i, (in_port, dpid, out_port) in enumerate(port_path)]
+
+    # per-packet consistent move: every packet runs either the old or the new path from end
+    # to end. Rules of the new version past the ingress only match the new tag, so they go in
+    # first; once every switch has them (barrier) the ingress rules are overwritten to tag with
+    # the new version, and after that barrier and a grace period the old rules are deleted
+    def update_flow(self, entry, dpid_path, port_path, cost, now):
+        self.vid = self.vid % VID_MAX + 1
+        old = [(entry.src, entry.dst, self._path_rules(entry.port_path, entry.vid)),
+               (entry.dst, entry.src, self._path_rules(reverse_path(entry.port_path), entry.vid))]
+        new = [(entry.src, entry.dst, self._path_rules(port_path, self.vid)),
+               (entry.dst, entry.src, self._path_rules(reverse_path(port_path), self.vid))]
+        internal = set()
+        for src_ip, dst_ip, rules in new:
+            for rule in rules[1:]:
+                self._send_rule(entry.eth_type, src_ip, dst_ip, rule)
+                internal.add(rule[1])
+        self.barriers.wait(self._datapaths(internal), self._flip_ingress, entry.eth_type, old, new)
+        self.network_awareness.path_cache.put(entry.src, entry.dst, entry.weight, dpid_path, port_path, cost)
+        self.flows.move(entry, dpid_path, port_path, cost, now)
+        entry.vid = self.vid
+
+    def _send_rule(self, eth_type, src_ip, dst_ip, rule):
+        in_port, dpid, out_port, vid, push_vid, pop = rule
+        dp = self.network_awareness.switch_info.get(dpid)
+        if dp is not None:
+            self.send_flow_mod(dp.ofproto_parser, dpid, eth_type, src_ip, dst_ip, in_port, out_port,
+                               vid, push_vid, pop)
+
+    def _datapaths(self, dpids):
+        return [self.network_awareness.switch_info[dpid] for dpid in dpids
+                if dpid in self.network_awareness.switch_info]
+
+    def _flip_ingress(self, eth_type, old, new):
+        # same match as the old ingress rule, so each direction switches with a single flow-mod
+        for src_ip, dst_ip, rules in new:
+            self._send_rule(eth_type, src_ip, dst_ip, rules[0])
+        ingress = set(rules[0][1] for src_ip, dst_ip, rules in new)
+        self.barriers.wait(self._datapaths(ingress), hub.spawn, self._collect_old, eth_type, old, new)
+
+    def _collect_old(self, eth_type, old, new):
+        hub.sleep(UPDATE_GRACE)
+        self._delete_old(eth_type, old, new)
+
+    # delete the old rules of each direction, but not the ones a new rule with the same match
+    # overwrote, such as the ingress rule when the ingress switch and in_port stay the same
+    def _delete_old(self, eth_type, old, new):
+        for (src_ip, dst_ip, old_rules), (a, b, new_rules) in zip(old, new):
+            kept = set((dpid, in_port, vid) for in_port, dpid, out_port, vid, push_vid, pop in new_rules)
+            for in_port, dpid, out_port, vid, push_vid, pop in old_rules:
+                if (dpid, in_port, vid) in kept:
+                    continue
+                dp = self.network_awareness.switch_info.get(dpid)
+                if dp is not None:
+                    self.send_flow_delete(dp.ofproto_parser, dpid, eth_type, src_ip, dst_ip, in_port, vid)
+
+    @set_ev_cls(ofp_event.EventOFPBarrierReply, MAIN_DISPATCHER)
+    def barrier_reply_handler(self, ev):
+        self.barriers.reply(ev.msg)
+
+    # rules matched on ips only are overwritten in place, the new groups are taken
+    # before the old ones are given back so groups both paths use stay on the switch
+    def move_failover_flow(self, entry, dpid_path, port_path, cost, now):
+        dp = self.network_awareness.switch_info[dpid_path[1]]
+        new_entry = self.install_flow(dp.ofproto_parser, entry.src, entry.dst, entry.eth_type,
+                                      dpid_path, port_path, cost, now)
+        new_entry.weight = entry.weight
+        for dpid, src_ip, dst_ip in set(entry.rules) - set(new_entry.rules):
+            dp = self.network_awareness.switch_info.get(dpid)
+            if dp is not None:
+                self.send_flow_delete(dp.ofproto_parser, dpid, entry.eth_type, src_ip, dst_ip)
+        self.release_groups(entry)
+        self.network_awareness.path_cache.put(entry.src, entry.dst, entry.weight, dpid_path, port_path, cost)
+
+    # delete every rule of a flow, the next packet of the pair asks for a new path
+    def remove_flow(self, entry):
+        if entry.rules is not None:
+            for dpid, src_ip, dst_ip in entry.rules:
+                dp = self.network_awareness.switch_info.get(dpid)
+                if dp is not None:
+                    self.send_flow_delete(dp.ofproto_parser, dpid, entry.eth_type, src_ip, dst_ip)
+            self.release_groups(entry)
+            self.flows.remove(entry.src, entry.dst)
+            return
+        for src_ip, dst_ip, port_path in [(entry.src, entry.dst, entry.port_path),
+                                          (entry.dst, entry.src, reverse_path(entry.port_path))]:
+            for in_port, dpid, out_port, vid, push_vid, pop in self._path_rules(port_path, entry.vid):
+                dp = self.network_awareness.switch_info.get(dpid)
+                if dp is not None:
+                    self.send_flow_delete(dp.ofproto_parser, dpid, entry.eth_type, src_ip, dst_ip, in_port, vid)
+        self.flows.remove(entry.src, entry.dst)
+
+    # (dpid, in_port, vid, src_ip, dst_ip) of every rule of the current path of a flow,
+    # in_port and vid are None where the rule does not match on them
+    def flow_rules(self, entry):
+        if entry.rules is not None:
+            return set((dpid, None, None, src_ip, dst_ip) for dpid, src_ip, dst_ip in entry.rules)
+        rules = set()
+        for src_ip, dst_ip, port_path in [(entry.src, entry.dst, entry.port_path),
+                                          (entry.dst, entry.src, reverse_path(entry.port_path))]:
+            for in_port, dpid, out_port, vid, push_vid, pop in self._path_rules(port_path, entry.vid):
+                rules.add((dpid, in_port, vid, src_ip, dst_ip))
+        return rules
+
+    # a rule of a flow idled or timed out, so its path is broken: the rest of the rules are
+    # deleted and the pair forgotten, the next packet of the pair installs a new path.
+    # Rules the controller deleted, or of a path the flow has moved off, are not its rules
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def flow_removed_handler(self, ev):
+        msg = ev.msg
+        ofp = msg.datapath.ofproto
+        if msg.reason == ofp.OFPRR_DELETE or msg.table_id != FORWARD_TABLE:
+            return
+        src_ip, dst_ip = msg.match.get('ipv4_src'), msg.match.get('ipv4_dst')
+        entry = self.flows.get(src_ip, dst_ip) or self.flows.get(dst_ip, src_ip)
+        if entry is None:
+            return
+        vid = msg.match.get('vlan_vid')
+        if vid is not None:
+            vid &= ~ofp.OFPVID_PRESENT
+        if (msg.datapath.id, msg.match.get('in_port'), vid, src_ip, dst_ip) in self.flow_rules(entry):
+            self.logger.info('flow {} -> {} timed out on s{}'.format(entry.src, entry.dst, msg.datapath.id))
+            self.remove_flow(entry)
+
+    # a port went down: only the flows crossing it are rerouted or removed
+    @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
+    def port_status_handler(self, ev):
+        msg = ev.msg
+        dp = msg.datapath
+        ofp = dp.ofproto
+        down = (msg.reason == ofp.OFPPR_DELETE or msg.desc.state & ofp.OFPPS_LINK_DOWN or
+                msg.desc.config & ofp.OFPPC_PORT_DOWN)
+        if not down:
+            return
+        dpid, port_no = dp.id, msg.desc.port_no
+        affected = self.flows.flows_on_link(dpid, port_no)
+        if not affected:
+            return
+        self.logger.info('port {}:{} down, {} of {} flows affected'.format(
+            dpid, port_no, len(affected), len(self.flows)))
+        link = self.network_awareness.port_link.get((dpid, port_no))
+        if link is not None:
+            self.network_awareness.path_cache.invalidate_link(*link)
+        now = time.monotonic()
+        for entry in affected:
+            dpid_path = self.network_awareness.best_path(entry.src, entry.dst, entry.weight)
+            port_path = self.network_awareness.get_port_path(dpid_path) if dpid_path else []
+            # topo_map may not have lost the link yet, never move onto the port again
+            if dpid_path and not any(d == dpid and port_no in (i, o) for i, d, o in port_path):
+                self.move_flow(entry, dpid_path, self.network_awareness.path_cost(dpid_path, entry.weight), now)
+            else:
+                self.remove_flow(entry)
+
+    # {dpid: number of rules} of the installed flows, to compare forwarding modes
+    def table_occupancy(self):
+        dpids = []
+        for entry in self.flows:
+            if entry.rules is not None:
+                dpids += [dpid for dpid, src_ip, dst_ip in entry.rules]
+            else:
+                dpids += [dpid for in_port, dpid, out_port in entry.port_path] * 2
+        return occupancy(dpids)
 
     def show_path(self, src, dst, port_path):
         self.logger.info('path: {} -> {}'.format(src, dst))
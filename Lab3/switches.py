@@ -253,7 +253,8 @@ class PortData(object):
         self.delay = 0
 
     def lldp_sent(self):
-        self.timestamp = time.time()
+        # monotonic, so lldp delay is not thrown off by wall clock jumps
+        self.timestamp = time.monotonic()
         self.sent += 1
 
     def lldp_received(self):
@@ -285,6 +286,7 @@ class PortDataState(dict):
         self._root = root = []  # sentinel node
         root[:] = [root, root, None]  # [_PREV, _NEXT, _KEY] doubly linked list
         self._map = {}
+        self._by_dpid_port = {}  # (dpid, port_no) -> PortData class
 
     def _remove_key(self, key):
         link_prev, link_next, key = self._map.pop(key)
@@ -315,6 +317,7 @@ class PortDataState(dict):
         if port not in self:
             self._prepend_key(port)
             self[port] = PortData(port.is_down(), lldp_data)
+            self._by_dpid_port[(port.dpid, port.port_no)] = self[port]
         else:
             self[port].is_down = port.is_down()
 
@@ -345,9 +348,13 @@ class PortDataState(dict):
     def get_port(self, port):
         return self[port]
 
+    def get_by_dpid_port(self, dpid, port_no):
+        return self._by_dpid_port.get((dpid, port_no))
+
     def del_port(self, port):
         del self[port]
         self._remove_key(port)
+        self._by_dpid_port.pop((port.dpid, port.port_no), None)
 
     def __iter__(self):
         root = self._root
@@ -362,6 +369,7 @@ class PortDataState(dict):
         root = self._root
         root[:] = [root, root, None]
         self._map.clear()
+        self._by_dpid_port.clear()
         dict.clear(self)
 
     def items(self):
@@ -570,6 +578,10 @@ class Switches(app_manager.RyuApp):
                 if p.port_no == port_no:
                     return p
 
+    def get_port_data(self, dpid, port_no):
+        # O(1) lookup of the PortData of a port, None if it is unknown
+        return self.ports.get_by_dpid_port(dpid, port_no)
+
     def _port_added(self, port):
         lldp_data = LLDPPacket.lldp_packet(
             port.dpid, port.port_no, port.hw_addr, self.DEFAULT_TTL)
@@ -770,7 +782,7 @@ class Switches(app_manager.RyuApp):
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def lldp_packet_in_handler(self, ev):
-        recv_timestamp = time.time()
+        recv_timestamp = time.monotonic()
         if not self.link_discovery:
             return
         msg = ev.msg
@@ -780,11 +792,9 @@ class Switches(app_manager.RyuApp):
             # This handler can receive all the packets which can be
             # not-LLDP packet. Ignore it silently
             return
-        for port, port_data in self.ports.items():
-            if src_dpid == port.dpid and src_port_no == port.port_no:
-                send_timestamp = port_data.timestamp
-                if send_timestamp:
-                    port_data.delay = recv_timestamp - send_timestamp
+        port_data = self.get_port_data(src_dpid, src_port_no)
+        if port_data is not None and port_data.timestamp:
+            port_data.delay = recv_timestamp - port_data.timestamp
 
         dst_dpid = msg.datapath.id
         if msg.datapath.ofproto.OFP_VERSION == ofproto_v1_0.OFP_VERSION:
@@ -927,7 +937,7 @@ class Switches(app_manager.RyuApp):
         while self.is_active:
             self.lldp_event.clear()
 
-            now = time.time()
+            now = time.monotonic()
             timeout = None
             ports_now = []
             ports = []
@@ -1024,3 +1034,34 @@ class Switches(app_manager.RyuApp):
 
         rep = event.EventHostReply(req.src, dpid, hosts)
         self.reply_to_request(req, rep)
+
+
+if __name__ == '__main__':
+    # python switches.py: cost of finding the sender port of one lldp packet,
+    # the old scan over every port against the (dpid, port_no) lookup
+    import random
+    from collections import namedtuple
+
+    OFPPort = namedtuple('OFPPort', 'port_no hw_addr name config state')
+    PORTS_PER_SWITCH = 4
+    LOOKUPS = 200
+    for n in [25, 500, 5000]:
+        ports = PortDataState()
+        for dpid in range(1, n + 1):
+            for port_no in range(1, PORTS_PER_SWITCH + 1):
+                ofpport = OFPPort(port_no, DONTCARE_STR, b'', 0, 0)
+                ports.add_port(Port(dpid, ofproto_v1_3, ofpport), b'')
+        rng = random.Random(1)
+        senders = [(rng.randint(1, n), rng.randint(1, PORTS_PER_SWITCH)) for _ in range(LOOKUPS)]
+        start = time.time()
+        for src_dpid, src_port_no in senders:
+            for port, port_data in ports.items():
+                if src_dpid == port.dpid and src_port_no == port.port_no:
+                    break
+        scan = (time.time() - start) / LOOKUPS
+        start = time.time()
+        for src_dpid, src_port_no in senders:
+            ports.get_by_dpid_port(src_dpid, src_port_no)
+        lookup = (time.time() - start) / LOOKUPS
+        print('{} switches, {} ports: scan {:.1f} us, lookup {:.2f} us per lldp packet'.format(
+            n, len(ports), scan * 1e6, lookup * 1e6))
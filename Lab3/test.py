@@ -9,6 +9,8 @@ from ryu.ofproto import ofproto_v1_3
 from ryu.topology.switches import LLDPPacket
 from ryu.base.app_manager import lookup_service_brick
 
+from echo_prober import EchoProber
+
 # 导入这些主要是为了让网络链路中产生LLDP数据包，只有产生了LLDP数据报，才能进行LLDP时延探测
 from ryu.topology.api import get_switch, get_link, get_host
 
@@ -24,6 +26,8 @@ class DelayDetector(app_manager.RyuApp):
         self.dpidSwitch = {}
         # 存储echo往返时延
         self.echoDelay = {}
+        # 同时向所有交换机发送echo报文，按xid匹配回应报文
+        self.echo_prober = EchoProber()
         # 存储LLDP时延
         self.src_dstDelay = {}
 
@@ -69,28 +73,19 @@ class DelayDetector(app_manager.RyuApp):
 
     # 由控制器向交换机发送echo报文，同时记录此时时间
     def send_echo_request(self):
-        # 循环遍历交换机，逐一向存在的交换机发送echo探测报文
-        for datapath in self.dpidSwitch.values():
-            parser = datapath.ofproto_parser
-            echo_req = parser.OFPEchoRequest(datapath, data=bytes("%.12f" % time.time(), encoding="utf8"))  # 获取当前时间
-
-            datapath.send_msg(echo_req)
-            # 每隔0.5秒向下一个交换机发送echo报文，防止回送报文同时到达控制器
-            hub.sleep(0.5)
+        # 一次性向所有交换机发送echo探测报文，回应报文按xid区分，不必逐一间隔0.5秒
+        self.echo_prober.sweep(self.dpidSwitch.values())
 
-    # 交换机向控制器的echo请求回应报文，收到此报文时，控制器通过当前时间-时间戳，计算出往返时延
+    # 交换机向控制器的echo请求回应报文，收到此报文时，控制器通过当前时间-发送时间，计算出往返时延
     @set_ev_cls(ofp_event.EventOFPEchoReply, [MAIN_DISPATCHER, CONFIG_DISPATCHER, HANDSHAKE_DISPATCHER])
     def echo_reply_handler(self, ev):
-        now_timestamp = time.time()
-        try:
-            echo_delay = now_timestamp - eval(ev.msg.data)
-            # 将交换机对应的echo时延写入字典保存起来
-            self.echoDelay[ev.msg.datapath.id] = echo_delay
-            print('*******************echo delay*****************')
-            print(self.echoDelay)
-        except Exception as error:
-            print(error)
+        echo_delay = self.echo_prober.reply(ev.msg)
+        if echo_delay is None:
             return
+        # 将交换机对应的echo时延写入字典保存起来
+        self.echoDelay[ev.msg.datapath.id] = echo_delay
+        print('*******************echo delay*****************')
+        print(self.echoDelay)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):  # 处理到达的LLDP报文，从而获得LLDP时延
@@ -101,14 +96,11 @@ class DelayDetector(app_manager.RyuApp):
             if self.switches is None:
                 self.switches = lookup_service_brick("switches")  # 获取交换机模块实例
 
-            # 获得key（Port类实例）和data（PortData类实例）
-            for port in self.switches.ports.keys():  # 开始获取对应交换机端口的发送时间戳
-                if src_dpid == port.dpid and src_outport == port.port_no:  # 匹配key
-                    port_data = self.switches.ports[port]  # 获取满足key条件的values值PortData实例，内部保存了发送LLDP报文时的timestamp信息
-                    timestamp = port_data.timestamp
-                    if timestamp:
-                        delay = time.time() - timestamp
-                        self._save_delay_data(src=src_dpid, dst=dst_dpid, src_port=src_outport, lldp_dealy=delay)
+            # 按(dpid, port_no)直接取得PortData类实例，内部保存了发送LLDP报文时的timestamp信息，不必遍历所有端口
+            port_data = self.switches.get_port_data(src_dpid, src_outport)
+            if port_data is not None and port_data.timestamp:
+                delay = time.monotonic() - port_data.timestamp  # switches记录的是单调时钟时间戳
+                self._save_delay_data(src=src_dpid, dst=dst_dpid, src_port=src_outport, lldp_dealy=delay)
         except Exception as error:
             print(error)
             return
@@ -12,6 +12,9 @@ from ryu.topology.api import get_host, get_link, get_switch
 from ryu.topology.switches import LLDPPacket
 
 import networkx as nx
+import itertools
+
+from path_cache import PathCache
 
 
 GET_TOPOLOGY_INTERVAL = 2
@@ -28,7 +31,11 @@ class NetworkAwareness(app_manager.RyuApp):
         self.switch_info = {}  # dpid: datapath
         self.link_info = {}  # (s1, s2): s1.port
         self.port_info = {}  # dpid: (ports linked hosts)
+        self.link_ports = set()  # (dpid, port) linked switches
         self.topo_map = nx.Graph()
+        self.topo_version = 0  # bumped on every change of topo_map
+        self.topo_hash = 0     # xor of the hashes of every host and link in topo_map
+        self.path_cache = PathCache()  # (src, dst, weight): dpid_path and port_path
         self.topo_thread = hub.spawn(self._get_topology)
 
     def add_flow(self, datapath, priority, match, actions):
@@ -63,47 +70,88 @@ class NetworkAwareness(app_manager.RyuApp):
             del self.switch_info[dpid]
 
     def _get_topology(self):
-        _hosts, _switches, _links = None, None, None
         while True:
             hosts = get_host(self)
             switches = get_switch(self)
             links = get_link(self)
 
-            # update topo_map when topology change
-            if [str(x) for x in hosts] == _hosts and [str(x) for x in switches] == _switches and [str(x) for x in links] == _links:
-                continue
-            _hosts, _switches, _links = [str(x) for x in hosts], [str(x) for x in switches], [str(x) for x in links]
-
+            # only bump topo_version when something really changed
+            version = self.topo_version
             for switch in switches:
                 self.port_info.setdefault(switch.dp.id, set())
                 # record all ports
                 for port in switch.ports:
-                    self.port_info[switch.dp.id].add(port.port_no)
+                    if (switch.dp.id, port.port_no) not in self.link_ports:
+                        self.port_info[switch.dp.id].add(port.port_no)
 
             for host in hosts:
                 # take one ipv4 address as host id
-                if host.ipv4:
+                if host.ipv4 and not self.topo_map.has_edge(host.ipv4[0], host.port.dpid):
                     self.link_info[(host.port.dpid, host.ipv4[0])] = host.port.port_no
                     self.topo_map.add_edge(host.ipv4[0], host.port.dpid, hop=1, delay=0, is_host=True)
+                    self._topo_changed(('host', host.ipv4[0], host.port.dpid))
             for link in links:
                 # delete ports linked switches
                 self.port_info[link.src.dpid].discard(link.src.port_no)
                 self.port_info[link.dst.dpid].discard(link.dst.port_no)
+                self.link_ports.add((link.src.dpid, link.src.port_no))
+                self.link_ports.add((link.dst.dpid, link.dst.port_no))
 
                 # s1 -> s2: s1.port, s2 -> s1: s2.port
                 self.link_info[(link.src.dpid, link.dst.dpid)] = link.src.port_no
                 self.link_info[(link.dst.dpid, link.src.dpid)] = link.dst.port_no
-                self.topo_map.add_edge(link.src.dpid, link.dst.dpid, hop=1, is_host=False)
-
-            # self.show_topo_map()
+                if not self.topo_map.has_edge(link.src.dpid, link.dst.dpid):
+                    self.topo_map.add_edge(link.src.dpid, link.dst.dpid, hop=1, is_host=False)
+                    # a new link may give a shorter path to anyone
+                    self.path_cache.clear()
+                    self._topo_changed(('link', frozenset((link.src.dpid, link.dst.dpid))))
+
+            # if self.changed_since(version):
+            #     self.show_topo_map()
             hub.sleep(GET_TOPOLOGY_INTERVAL)
 
+    # every change of topo_map goes through here, so "has anything changed since
+    # version N" is a single compare and the hash identifies the current topology
+    def _topo_changed(self, *items):
+        self.topo_version += 1
+        for item in items:
+            self.topo_hash ^= hash(item)
+
+    def changed_since(self, version):
+        return self.topo_version != version
+
+    # dpid_path and port_path from src host to dst host, served from path_cache when possible
+    def get_path(self, src, dst, weight='hop'):
+        entry = self.path_cache.get(src, dst, weight)
+        if entry is not None:
+            return entry.dpid_path, entry.port_path
+        dpid_path = self.shortest_path(src, dst, weight=weight)
+        if not dpid_path:
+            return None, None
+
+        # get port path:  h1 -> in_port, s1, out_port -> h2
+        port_path = []
+        for i in range(1, len(dpid_path) - 1):
+            in_port = self.link_info[(dpid_path[i], dpid_path[i - 1])]
+            out_port = self.link_info[(dpid_path[i], dpid_path[i + 1])]
+            port_path.append((in_port, dpid_path[i], out_port))
+        cost = sum(self.topo_map.edges[u, v].get(weight, 1) for u, v in zip(dpid_path, dpid_path[1:]))
+        self.path_cache.put(src, dst, weight, dpid_path, port_path, cost)
+        return dpid_path, port_path
+
     def shortest_path(self, src, dst, weight='hop'):
+        return next(self.k_shortest_paths(src, dst, 1, weight), None)
+
+    # yield the k shortest loop-free paths in order, each one computed only when asked for
+    def k_shortest_paths(self, src, dst, k=1, weight='hop'):
         try:
-            paths = list(nx.shortest_simple_paths(self.topo_map, src, dst, weight=weight))
-            return paths[0]
-        except:
-            return None
+            if k == 1:
+                yield nx.dijkstra_path(self.topo_map, src, dst, weight=weight)
+                return
+            for path in itertools.islice(nx.shortest_simple_paths(self.topo_map, src, dst, weight=weight), k):
+                yield path
+        except nx.NetworkXException:
+            return
 
     def show_topo_map(self):
         self.logger.info('topo map:')
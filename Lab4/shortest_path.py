@@ -107,15 +107,10 @@ class ShortestPath(app_manager.RyuApp):
     def handle_ipv4(self, msg, src_ip, dst_ip, pkt_type):
         parser = msg.datapath.ofproto_parser
 
-        dpid_path = self.network_awareness.shortest_path(src_ip, dst_ip)
+        dpid_path, port_path = self.network_awareness.get_path(src_ip, dst_ip)
         if not dpid_path:
             return
 
-        port_path = []
-        for i in range(1, len(dpid_path) - 1):
-            in_port = self.network_awareness.link_info[(dpid_path[i], dpid_path[i - 1])]
-            out_port = self.network_awareness.link_info[(dpid_path[i], dpid_path[i + 1])]
-            port_path.append((in_port, dpid_path[i], out_port))
         self.show_path(src_ip, dst_ip, port_path)
 
         # send flow mod